@@ -11,19 +11,46 @@ from .time_utils import *
 from .notification import *
 from ._internal import *
 from .assets import *
+from .code_cache import *
+from .trace import *
+from .history import *
+from .cache import *
+from .metrics import *
+from .trash import Trash
 
 __all__ = [
     "Console", "ConsoleStyle",
-    "Path", "FSEntry", "File", "Directory",
+    "Path", "FSEntry", "File", "Directory", "DirectoryEntry",
+    "RetentionPolicy", "RetentionReport",
+    "Snapshot", "SnapshotEntry", "SnapshotDiff",
+    "SyncReport", "PatchRule",
+    "Trash",
     "ToStringBuilder", "ReprBuilderMixin",
     "Runner",
     "Script", "die", "success",
     "DateTime", "DateTimeFormat", "TimeCounter", "Duration", "DurationFormat",
     "NotificationConfig", "show_notification",
+    "Notifications", "NotificationBackend",
     "Safe",
     "Assets", "IconAsset",
     "strip_comments",
+    "CodeCache",
+    "Trace",
+    "RunHistory",
+    "cached", "CacheStats",
+    "Metrics",
 ]
 
+
+def __getattr__(name):
+    # PEP 562: watch loads ctypes and select, so it is imported only when requested. Watcher and ChangeSet are
+    # not in __all__ either, mk does `from .core import *` which would resolve them
+    if name in ("Watcher", "ChangeSet"):
+        from . import watch  # pylint: disable=import-outside-toplevel
+
+        return getattr(watch, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # dependencies injection
 Dependencies.die = Script.die
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# cSpell: words
+
+# Child process entry point for Script.run_subscripts_parallel():
+#   python -m mk.core._subscript_worker <subscript path> <input file> <output file>
+# The input file is a pickled dict with the parent stack paths and init globals.
+# The output file receives a pickled dict with the exit code, the error summary and the result.
+
+import sys
+import types
+import pickle
+
+
+def _picklable_globals(run_globals: dict) -> dict:
+    result = {}
+    for k, v in run_globals.items():
+        # data only: functions, classes and modules are of no use to the parent
+        if k.startswith("__") or callable(v) or isinstance(v, types.ModuleType):
+            continue
+        try:
+            pickle.dumps(v)
+        except Exception:
+            continue
+        result[k] = v
+    return result
+
+
+def main():
+    path, input_path, output_path = sys.argv[1:4]
+    with open(input_path, "rb") as f:
+        params = pickle.load(f)
+
+    # pylint: disable=import-outside-toplevel, protected-access
+    from mk.core.script import Script, _Stack
+    from mk.core.code_cache import CodeCache
+    from mk.core.trace import Trace
+    from mk.core.profiling import Profiling
+    from mk.core.history import RunHistory
+    from mk.core.metrics import Metrics
+    from mk.core.trash import Trash
+
+    Script._exit_notifications = False
+    # recreate the parent stack so the nested `A >> B` naming is kept
+    Script._stack = _Stack()
+    for parent_path in params["stack"]:
+        Script._stack.push(parent_path)
+    Script._stack.push(path)
+    item = Script._stack.current
+    if params["clipboard"] is not None:
+        Script.use_shared_clipboard(params["clipboard"])
+
+    payload = {"code": 0, "error": None, "result": None}
+    try:
+        try:
+            with Trace.span(Script._stack.display_path, "subscript", {"path": path}):
+                run_globals = CodeCache.run_path(path, init_globals=params["init_globals"])
+        except Exception as e:
+            Script.die(f"Unable to run subscript [{path}]: {e}")
+        payload["result"] = item.result if item.has_result else _picklable_globals(run_globals)
+    except SystemExit as e:
+        # as the interpreter does: None is a success, anything else but an int is printed and fails
+        if e.code is None:
+            payload["code"] = 0
+        elif isinstance(e.code, int):
+            payload["code"] = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            payload["code"] = 1
+        if payload["code"]:
+            payload["error"] = Script._exit_summary or (None if isinstance(e.code, int) else str(e.code))
+
+    Trace.write(process_name=Script._stack.display_path)
+    if Profiling.is_enabled():
+        Script._finish_profiling()
+    if RunHistory.is_enabled():
+        Script._record_history("failed" if payload["code"] else "finished")
+    if Metrics.is_enabled():
+        # the Runner metrics of the subscript, merged into the textfile state; the run outcome is the parent's
+        Metrics.write_textfile()
+    if Trash.pending():
+        Trash.finish()
+    with open(output_path, "wb") as f:
+        pickle.dump(payload, f)
+    sys.exit(payload["code"])
+
+
+if __name__ == "__main__":
+    main()
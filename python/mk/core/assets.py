@@ -1,8 +1,7 @@
 # -*- coding: utf-8 -*-
 # cSpell: words
 
-import inspect
-import pathlib
+import os
 from .fs import Directory, Path
 
 
@@ -21,14 +20,16 @@ class Assets:
 
     @classmethod
     def _init(cls):
-        frame = inspect.currentframe()
-        assert frame is not None
-        p = pathlib.Path(inspect.getframeinfo(frame).filename).resolve().parent.parent.parent.parent.joinpath('assets')
+        # <repo>/python/mk/core/assets.py -> <repo>/assets. Deferred until the first asset is actually needed
+        p = Path([os.path.realpath(__file__), "..", "..", "..", "..", "assets"])
         cls._directory = Directory(p, must_exist=True, create_if_needed=False)
 
     @classmethod
-    def get_icon(cls, icon_name: str) -> IconAsset:
-        return IconAsset(Path([cls._directory, f'{icon_name}.png']))
-
+    def get_directory(cls) -> Directory:
+        if cls._directory is None:
+            cls._init()
+        return cls._directory  # type: ignore
 
-Assets._init()  # pylint: disable=protected-access
+    @classmethod
+    def get_icon(cls, icon_name: str) -> IconAsset:
+        return IconAsset(Path([cls.get_directory(), f'{icon_name}.png']))
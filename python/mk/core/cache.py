@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# cSpell: words sqlite
+
+import os
+import time
+import atexit
+import pickle
+import sqlite3
+import functools
+import threading
+from typing import Callable
+from .to_string_builder import ReprBuilderMixin, ToStringBuilder
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    func TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    files BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (func, key)
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (func, accessed_at);
+"""
+
+
+class CacheStats(ReprBuilderMixin):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.add("hits", self.hits)
+        sb.add("misses", self.misses)
+        sb.add("evictions", self.evictions)
+
+
+class _Store:
+    """The SQLite database shared by all the cached functions of the process"""
+
+    _db: sqlite3.Connection | None = None
+    _lock = threading.Lock()
+    _open_lock = threading.Lock()
+    # hits are not written one by one: (func, key) -> accessed_at, flushed in one transaction
+    _touched: dict = {}
+    _TOUCHED_FLUSH_SIZE = 1000
+
+    @classmethod
+    def db(cls) -> sqlite3.Connection:
+        if cls._db is None:
+            with cls._open_lock:
+                if cls._db is None:
+                    from .fs import Directory  # pylint: disable=import-outside-toplevel
+
+                    path = (Directory.user_cache().path + "cached.sqlite").fspath
+                    db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.executescript(_SCHEMA)
+                    atexit.register(cls.flush)
+                    cls._db = db  # published once ready, other threads may be waiting for it
+        return cls._db
+
+    @classmethod
+    def touch(cls, func_id: str, key: str, now: float):
+        """Called under the lock"""
+        cls._touched[(func_id, key)] = now
+        if len(cls._touched) >= cls._TOUCHED_FLUSH_SIZE:
+            cls._flush_touched()
+
+    @classmethod
+    def flush(cls):
+        with cls._lock:
+            cls._flush_touched()
+
+    @classmethod
+    def _flush_touched(cls):
+        if not cls._touched or cls._db is None:
+            return
+        touched = cls._touched
+        cls._touched = {}
+        try:
+            with cls._db:  # a single write transaction
+                cls._db.execute("BEGIN")
+                cls._db.executemany(
+                    "UPDATE entries SET accessed_at = ? WHERE func = ? AND key = ?",
+                    [(now, func_id, key) for (func_id, key), now in touched.items()],
+                )
+        except sqlite3.Error:
+            pass  # the access times only order the evictions
+
+
+def _file_signatures(paths) -> list:
+    result = []
+    for path in paths:
+        p = os.fspath(path)
+        try:
+            st = os.stat(p)
+            result.append((p, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            result.append((p, None, None))
+    return result
+
+
+def cached(
+    ttl: float | None = None,
+    key: Callable[..., object] | None = None,
+    max_entries: int | None = 1000,
+    depends_on_files=None,
+):
+    """
+    Persistent memoization in the user cache directory, shared between runs and processes.
+    [ttl]: seconds a result stays valid, forever if None.
+    [key]: maps the call arguments to the cache key, repr() of the arguments by default.
+    [max_entries]: least recently used results above the limit are evicted (down to 90% of it, in one go).
+    [depends_on_files]: paths (or a callable taking the call arguments and returning paths);
+        a result is invalidated when any of the files changes its mtime or size.
+    Results must be picklable. The wrapper exposes `cache_stats` and `cache_clear()`.
+    """
+
+    def decorator(f):
+        func_id = f"{f.__module__}.{f.__qualname__}"
+        stats = CacheStats()
+        # upper bound of the number of entries (replacements are counted as inserts), None until counted
+        entry_count = [None]
+
+        def make_key(args, kwargs) -> str:
+            import hashlib  # pylint: disable=import-outside-toplevel
+
+            k = key(*args, **kwargs) if key is not None else (args, sorted(kwargs.items()))
+            return hashlib.sha256(repr(k).encode("utf-8")).hexdigest()
+
+        def dependencies(args, kwargs) -> list:
+            if depends_on_files is None:
+                return []
+            paths = depends_on_files(*args, **kwargs) if callable(depends_on_files) else depends_on_files
+            return _file_signatures(paths if isinstance(paths, (list, tuple)) else [paths])
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            k = make_key(args, kwargs)
+            files = dependencies(args, kwargs)
+            now = time.time()
+            db = _Store.db()
+
+            with _Store._lock:  # pylint: disable=protected-access
+                row = db.execute(
+                    "SELECT value, files, created_at FROM entries WHERE func = ? AND key = ?", (func_id, k)
+                ).fetchone()
+                if row is not None:
+                    value, stored_files, created_at = row
+                    if (ttl is None or now - created_at <= ttl) and pickle.loads(stored_files) == files:
+                        _Store.touch(func_id, k, now)
+                        stats.hits += 1
+                        return pickle.loads(value)
+
+            stats.misses += 1
+            result = f(*args, **kwargs)
+
+            with _Store._lock:  # pylint: disable=protected-access
+                db.execute(
+                    "INSERT OR REPLACE INTO entries (func, key, value, files, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (func_id, k, pickle.dumps(result), pickle.dumps(files), now, now),
+                )
+                if max_entries is not None:
+                    if entry_count[0] is None:
+                        entry_count[0] = db.execute("SELECT COUNT(*) FROM entries WHERE func = ?", (func_id,)).fetchone()[0]
+                    else:
+                        entry_count[0] += 1
+                    if entry_count[0] > max_entries:
+                        _Store._flush_touched()  # pylint: disable=protected-access # the LRU order needs the hits
+                        cursor = db.execute(
+                            "DELETE FROM entries WHERE func = ? AND key NOT IN"
+                            " (SELECT key FROM entries WHERE func = ? ORDER BY accessed_at DESC LIMIT ?)",
+                            (func_id, func_id, max_entries * 9 // 10),
+                        )
+                        stats.evictions += max(cursor.rowcount, 0)
+                        entry_count[0] = db.execute("SELECT COUNT(*) FROM entries WHERE func = ?", (func_id,)).fetchone()[0]
+            return result
+
+        def cache_clear():
+            with _Store._lock:  # pylint: disable=protected-access
+                _Store.db().execute("DELETE FROM entries WHERE func = ?", (func_id,))
+                entry_count[0] = 0
+
+        wrapper.cache_stats = stats
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
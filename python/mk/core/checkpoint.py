@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# cSpell: words
+
+import os
+import json
+import pickle
+from .fs import Directory
+from .misc import Safe
+
+
+class CheckpointStore:
+    """
+    Persistent state of completed checkpoints of a script run, keyed by the script path and arguments.
+    Each entry keeps a digest of the checkpoint inputs, the recorded clipboard outputs and the action result.
+    """
+
+    def __init__(self, script_path, args: list[str], resume: bool):
+        import hashlib  # pylint: disable=import-outside-toplevel
+
+        key = json.dumps([os.path.realpath(os.fspath(script_path))] + list(args))
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        self.file_path = Directory.user_cache("checkpoints").path + f"{digest}.pickle"
+        self._entries = {}
+        if resume:
+            self._load()
+        else:
+            self.discard()
+
+    @staticmethod
+    def digest_inputs(inputs) -> str:
+        import hashlib  # pylint: disable=import-outside-toplevel
+
+        s = json.dumps(inputs, sort_keys=True, default=Safe.stringify)
+        return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        try:
+            with open(self.file_path.fspath, "rb") as f:
+                self._entries = pickle.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+
+    def _save(self):
+        tmp_path = f"{self.file_path.fspath}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._entries, f)
+        os.replace(tmp_path, self.file_path.fspath)
+
+    def get_completed(self, name: str, inputs_digest: str) -> dict | None:
+        entry = self._entries.get(name)
+        if entry is None or entry["inputs"] != inputs_digest:
+            return None
+        return entry
+
+    def set_completed(self, name: str, inputs_digest: str, outputs: dict, result):
+        self._entries[name] = {"inputs": inputs_digest, "outputs": outputs, "result": result}
+        self._save()
+
+    def discard(self):
+        self._entries = {}
+        try:
+            os.unlink(self.file_path.fspath)
+        except FileNotFoundError:
+            pass
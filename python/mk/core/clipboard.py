@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# cSpell: words isolation sqlite
+
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Any, Callable
+from .fs import Path
+
+MISSING = object()
+# returned by an update() function to leave the store untouched
+UNCHANGED = object()
+
+
+class MemoryClipboardBackend:
+    """In-process storage, the default one"""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key: str, default=MISSING):
+        return self._data.get(key, default)
+
+    def set(self, key: str, value):
+        self._data[key] = value
+
+    def remove(self, key: str):
+        self._data.pop(key, None)
+
+    def items(self) -> list:
+        return list(self._data.items())
+
+    def update(self, key: str, f: Callable[[Any], Any]):
+        """Stores f(current value or MISSING) and returns it, f may return UNCHANGED"""
+        current = self._data.get(key, MISSING)
+        value = f(current)
+        if value is UNCHANGED:
+            return current
+        self._data[key] = value
+        return value
+
+
+class SQLiteClipboardBackend:
+    """
+    Storage shared between processes and runs: an SQLite database in WAL mode, values are pickled.
+    Readers never block writers, read-modify-write updates are done in an immediate transaction.
+    """
+
+    def __init__(self, path, delete_on_close: bool = False):
+        """[delete_on_close]: a temporary store, close() deletes the database and its WAL files"""
+        self.path = Path(path)
+        self.delete_on_close = delete_on_close
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path.fspath, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS clipboard (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    def get(self, key: str, default=MISSING):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM clipboard WHERE key = ?", (key,)).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO clipboard (key, value) VALUES (?, ?)", (key, pickle.dumps(value)))
+
+    def remove(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM clipboard WHERE key = ?", (key,))
+
+    def items(self) -> list:
+        with self._lock:
+            rows = self._db.execute("SELECT key, value FROM clipboard ORDER BY rowid").fetchall()
+        return [(k, pickle.loads(v)) for k, v in rows]
+
+    def update(self, key: str, f: Callable[[Any], Any]):
+        """Stores f(current value or MISSING) and returns it, f may return UNCHANGED. Atomic across processes"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT value FROM clipboard WHERE key = ?", (key,)).fetchone()
+                current = MISSING if row is None else pickle.loads(row[0])
+                value = f(current)
+                if value is UNCHANGED:
+                    value = current
+                else:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO clipboard (key, value) VALUES (?, ?)", (key, pickle.dumps(value))
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return value
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        if self.delete_on_close:
+            for suffix in ["", "-wal", "-shm"]:
+                try:
+                    os.unlink(self.path.fspath + suffix)
+                except FileNotFoundError:
+                    pass
+
+
+def default_shared_clipboard_path() -> Path:
+    import tempfile  # pylint: disable=import-outside-toplevel
+
+    return Path([tempfile.gettempdir(), f"mk-clipboard-{os.getpid()}.sqlite"])
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# cSpell: words pycache fspath marshal runpy
+
+import os
+import sys
+import types
+import marshal
+import importlib.util
+from .to_string_builder import ReprBuilderMixin, ToStringBuilder
+
+
+class CodeCacheStats(ReprBuilderMixin):
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.memory_hits + self.disk_hits + self.misses
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.typename = "CodeCache"
+        sb.add("memory_hits", self.memory_hits)
+        sb.add("disk_hits", self.disk_hits)
+        sb.add("misses", self.misses)
+
+
+class CodeCache:
+    """
+    Compiled code objects of subscripts and modules run via Script, keyed by (path, mtime, size).
+    Repeated runs of the same unchanged file skip reading, parsing and compilation.
+    The optional disk layer uses the regular `__pycache__` .pyc format, so it is shared with the import system.
+    """
+
+    _entries = {}  # path -> (mtime_ns, size, code)
+    _use_disk = False
+    stats = CodeCacheStats()
+
+    @classmethod
+    def configure(cls, use_disk: bool | None = None):
+        if use_disk is not None:
+            cls._use_disk = use_disk
+
+    @classmethod
+    def clear(cls):
+        cls._entries = {}
+        cls.stats = CodeCacheStats()
+
+    @classmethod
+    def get_code(cls, path) -> types.CodeType:
+        fspath = os.fspath(path)
+        st = os.stat(fspath)
+
+        entry = cls._entries.get(fspath)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            cls.stats.memory_hits += 1
+            return entry[2]
+
+        code = cls._load_from_disk(fspath, st) if cls._use_disk else None
+        if code is not None:
+            cls.stats.disk_hits += 1
+        else:
+            cls.stats.misses += 1
+            with open(fspath, "rb") as f:
+                source = f.read()
+            code = compile(source, fspath, "exec", dont_inherit=True)
+            # PYTHONDONTWRITEBYTECODE / -B: read only, as the import system does
+            if cls._use_disk and not sys.dont_write_bytecode:
+                cls._save_to_disk(fspath, st, code)
+
+        cls._entries[fspath] = (st.st_mtime_ns, st.st_size, code)
+        return code
+
+    @staticmethod
+    def _pyc_header(st) -> bytes:
+        # PEP 552 timestamp-based pyc: magic, flags, mtime, source size
+        return (
+            importlib.util.MAGIC_NUMBER
+            + (0).to_bytes(4, "little")
+            + (int(st.st_mtime) & 0xFFFFFFFF).to_bytes(4, "little")
+            + (st.st_size & 0xFFFFFFFF).to_bytes(4, "little")
+        )
+
+    @classmethod
+    def _load_from_disk(cls, fspath, st):
+        try:
+            with open(importlib.util.cache_from_source(fspath), "rb") as f:
+                data = f.read()
+            header = cls._pyc_header(st)
+            if data[: len(header)] != header:
+                return None
+            code = marshal.loads(data[len(header) :])
+            return code if isinstance(code, types.CodeType) else None
+        except Exception:
+            return None
+
+    @classmethod
+    def _save_to_disk(cls, fspath, st, code):
+        # same as the import system: failing to write the cache is not an error
+        try:
+            pyc_path = importlib.util.cache_from_source(fspath)
+            os.makedirs(os.path.dirname(pyc_path), exist_ok=True)
+            tmp_path = f"{pyc_path}.{os.getpid()}"
+            with open(tmp_path, "wb") as f:
+                f.write(cls._pyc_header(st) + marshal.dumps(code))
+            os.replace(tmp_path, pyc_path)
+        except Exception:
+            pass
+
+    @classmethod
+    def run_path(cls, path, init_globals=None, run_name: str = "<run_path>") -> dict:
+        """
+        runpy.run_path() replacement for plain source files that takes the code object from the cache.
+        Anything else (.pyc files, zip archives, directories with a __main__.py) goes to runpy.run_path() itself.
+        Returns the resulting module globals dictionary.
+        """
+        fspath = os.fspath(path)
+        if not fspath.endswith(".py") or not os.path.isfile(fspath):
+            import runpy  # pylint: disable=import-outside-toplevel
+
+            return runpy.run_path(fspath, init_globals=init_globals, run_name=run_name)
+        code = cls.get_code(fspath)
+
+        module = types.ModuleType(run_name)
+        run_globals = module.__dict__
+        if init_globals is not None:
+            run_globals.update(init_globals)
+        run_globals.update(
+            __name__=run_name,
+            __file__=fspath,
+            __cached__=None,
+            __loader__=None,
+            __package__=None,
+            __spec__=None,
+        )
+
+        # the same temporary sys.modules entry and argv[0] replacement as runpy does
+        saved_module = sys.modules.get(run_name)
+        saved_argv0 = sys.argv[0] if sys.argv else None
+        sys.modules[run_name] = module
+        if sys.argv:
+            sys.argv[0] = fspath
+        try:
+            exec(code, run_globals)  # pylint: disable=exec-used
+        finally:
+            if sys.argv:
+                sys.argv[0] = saved_argv0
+            if saved_module is not None:
+                sys.modules[run_name] = saved_module
+            else:
+                sys.modules.pop(run_name, None)
+        return run_globals.copy()
@@ -2,10 +2,6 @@
 # cSpell: words popen bgcolor renderable
 
 from enum import Enum
-import rich.console
-import rich.style
-import rich.text
-import rich.color
 from .misc import Safe
 from .time_utils import Duration, DurationFormat, TimeCounter, script_time_counter
 from io import StringIO
@@ -27,19 +23,22 @@ class ConsoleStyleConfig:
 
     def get_rich_style(self):
         if self._rich_style is None:
+            import rich.style  # pylint: disable=import-outside-toplevel
+
             self._rich_style = rich.style.Style(
                 color=self.color, bold=self.bold, bgcolor=self.background_color
             )
         return self._rich_style
 
 
-class _TimedTitle(rich.console.RichCast):
-    def __init__(self, title) -> None:  # ignore: super-init-not-called
-        # super().__init__() No protocol instantiation
+class _TimedTitle:  # rich.console.RichCast protocol
+    def __init__(self, title) -> None:
         self.title = title
         self.time_counter = TimeCounter()
 
     def __rich__(self):
+        import rich.text  # pylint: disable=import-outside-toplevel
+
         t = rich.text.Text()
         ed1 = self.time_counter.elapsed_duration.format(DurationFormat.S)
         ed2 = script_time_counter.elapsed_duration.format(DurationFormat.S)
@@ -53,26 +52,30 @@ class Console:
 
     _styles = {
         ConsoleStyle.SECTION_HEADER: ConsoleStyleConfig(
-            color=rich.color.Color.from_ansi(153), bold=True
+            color="color(153)", bold=True
         ),  #
         ConsoleStyle.SUCCESS: ConsoleStyleConfig(color="bright_green"),
         ConsoleStyle.WARNING: ConsoleStyleConfig(
-            color=rich.color.Color.from_ansi(226)
+            color="color(226)"
         ),  # color="bright_yellow"),
         # ConsoleStyle.FATAL_ERROR: ConsoleStyleConfig(color="bright_white", background_color="bright_red",),
         # ConsoleStyle.FATAL_ERROR: ConsoleStyleConfig(color="bright_red"),
         ConsoleStyle.FATAL_ERROR: ConsoleStyleConfig(
-            background_color=rich.color.Color.from_ansi(160), color="bright_white"
+            background_color="color(160)", color="bright_white"
         ),
         # ConsoleStyle.RUN_STATUS: ConsoleStyleConfig(background_color="grey3", color="bright_white"),
     }
 
     _status = None
-    _rc: rich.console.Console
-    _rc_for_file: rich.console.Console
+    _rc = None  # rich.console.Console, created on first use
+    _rc_for_file = None
 
     @classmethod
     def _init(cls):
+        # rich is heavy to import, so the consoles are created on first output rather than on `import mk`
+        if cls._rc is not None:
+            return
+        import rich.console  # pylint: disable=import-outside-toplevel
 
         # underlying console processor. https://rich.readthedocs.io/en/latest/index.html
         cls._rc_for_file = rich.console.Console(  # pylint: disable=invalid-name
@@ -82,6 +85,27 @@ class Console:
             highlight=False, markup=False, log_path=False
         )
 
+    @classmethod
+    def _reset(cls):
+        """Forgets the consoles and the log, e.g. after the standard streams are replaced in a forked process"""
+        cls._rc = None
+        cls._rc_for_file = None
+        cls._status = None
+        cls._prev_line_empty = False
+        cls._history = []
+        cls._history_file = None
+        cls._history_file_path = None
+
+    @classmethod
+    def _console(cls):
+        cls._init()
+        return cls._rc
+
+    @classmethod
+    def _file_console(cls):
+        cls._init()
+        return cls._rc_for_file
+
     @classmethod
     def dump_styles(cls):
         for style in cls._styles:
@@ -93,16 +117,16 @@ class Console:
             try:
                 return cls._styles[style]
             except Exception as e:
-                cls._rc.print(
+                cls._console().print(
                     f"mk.Console: {e} Warning: unable to resolve the console style '{style.name}'",
-                    style=rich.style.Style(color="yellow"),
+                    style="yellow",
                     highlight=False,
                 )
         return None
 
     @classmethod
     def write_raw(cls, rich_renderable):
-        cls._rc.print(rich_renderable)
+        cls._console().print(rich_renderable)
         cls._log(rich_renderable)
         cls._prev_line_empty = False
 
@@ -112,8 +136,9 @@ class Console:
             # cls._rcl.log(o)
             # log_text = cls._rcl.export_text()
             # cls._add_to_history(log_text)
-        cls._rc_for_file.log(o)
-        log_text = cls._rc_for_file.export_text()
+        rc_for_file = cls._file_console()
+        rc_for_file.log(o)
+        log_text = rc_for_file.export_text()
         cls._add_to_history(log_text)
 
     @classmethod
@@ -128,7 +153,7 @@ class Console:
         if to_display:
             style_config = cls._resolve_style(style)
             rc_style = style_config.get_rich_style() if style_config != None else None
-            cls._rc.print(text, style=rc_style)
+            cls._console().print(text, style=rc_style)
 
         # we log always
         cls._log(text)
@@ -142,7 +167,7 @@ class Console:
     @classmethod
     def start_status(cls, title):
         cls.stop_status()
-        cls._status = cls._rc.status(_TimedTitle(title))
+        cls._status = cls._console().status(_TimedTitle(title))
         cls._status.start()
 
     # @classmethod
@@ -181,6 +206,10 @@ class Console:
             assert flush_capacity >= 1
             cls._flush_capacity = flush_capacity
 
+    @classmethod
+    def log_file_path(cls):
+        return cls._history_file_path
+
     @classmethod
     def _add_to_history(cls, s):
         if cls._history_file is not None:
@@ -202,5 +231,3 @@ class Console:
         cls.stop_status()
         cls.flush()
 
-
-Console._init()  # pylint: disable=protected-access
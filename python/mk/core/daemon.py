@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# cSpell: words dup2 getuid SIGCHLD runpy
+
+# Warm daemon: a long-living interpreter with mk and its heavy dependencies already imported.
+# Each request is served by a forked worker that takes over the client stdio, cwd, environment and argv.
+# Started and used via the tiny client, see mkd.py next to the `mk` package.
+
+import os
+import io
+import sys
+import json
+import runpy
+import types
+import atexit
+import signal
+import socket
+import struct
+from .console import Console
+from .code_cache import CodeCache
+from .script import Script
+
+_LENGTH = struct.Struct("!Q")
+_PID = struct.Struct("!q")
+_CODE = struct.Struct("!i")
+
+
+def default_socket_path() -> str:
+    # keep in sync with mkd.py
+    path = os.environ.get("MK_DAEMON_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "mk-daemon.sock")
+    return f"/tmp/mk-daemon-{os.getuid()}.sock"
+
+
+def _warm_up():
+    # pylint: disable=import-outside-toplevel, unused-import
+    import rich.console
+    import rich.table
+    import rich.rule
+    import rich.text
+    import rich.style
+    import dateutil.tz
+
+    try:
+        import PIL.Image
+    except ImportError:
+        pass
+
+
+def _receive_request(conn: socket.socket):
+    data, fds, _, _ = socket.recv_fds(conn, _LENGTH.size, 3)
+    while len(data) < _LENGTH.size:
+        chunk = conn.recv(_LENGTH.size - len(data))
+        if not chunk:
+            raise ConnectionError("incomplete request")
+        data += chunk
+    (length,) = _LENGTH.unpack(data)
+    body = b""
+    while len(body) < length:
+        chunk = conn.recv(length - len(body))
+        if not chunk:
+            raise ConnectionError("incomplete request")
+        body += chunk
+    return json.loads(body.decode("utf-8")), fds
+
+
+def _reopen_stdio():
+    def text_stream(fd, mode):
+        line_buffered = mode == "w" and os.isatty(fd)
+        return open(fd, mode, encoding="utf-8", errors="backslashreplace", buffering=1 if line_buffered else -1, closefd=False)
+
+    sys.stdin = text_stream(0, "r")
+    sys.stdout = text_stream(1, "w")
+    sys.stderr = io.TextIOWrapper(open(2, "wb", buffering=0, closefd=False), encoding="utf-8", errors="backslashreplace", write_through=True)
+
+
+def _exit_code(code) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_worker(conn: socket.socket, fds: list, request: dict):
+    """The forked worker: behaves as `python <argv>` started by the client. Never returns"""
+    code = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        conn.sendall(_PID.pack(os.getpid()))
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        _reopen_stdio()
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        sys.argv = list(request["argv"])
+        module, source = request.get("module"), request.get("code")
+        # sys.path[0] and the entry point detection as with python -m/-c/<script>
+        if module is not None:
+            sys.path[0] = os.getcwd()
+        elif source is not None:
+            sys.path[0] = ""
+        else:
+            sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+
+        Console._reset()  # pylint: disable=protected-access
+        Script._init_run(entry_point=module is None and source is None)  # pylint: disable=protected-access
+        try:
+            if module is not None:
+                runpy.run_module(module, run_name="__main__", alter_sys=True)
+            elif source is not None:
+                main_module = types.ModuleType("__main__")
+                sys.modules["__main__"] = main_module
+                exec(compile(source, "<string>", "exec"), main_module.__dict__)  # pylint: disable=exec-used
+            else:
+                CodeCache.run_path(sys.argv[0], run_name="__main__")
+            code = 0
+        except SystemExit as e:
+            code = _exit_code(e.code)
+        except KeyboardInterrupt:
+            sys.excepthook(*sys.exc_info())
+            code = 130
+        except BaseException:  # pylint: disable=broad-except
+            sys.excepthook(*sys.exc_info())
+            code = 1
+        Script._exit_code = code  # pylint: disable=protected-access # the exit handlers decide on it
+        try:
+            atexit._run_exitfuncs()  # pylint: disable=protected-access
+        except SystemExit as e:
+            code = _exit_code(e.code)
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        try:
+            conn.sendall(_CODE.pack(code))
+        finally:
+            os._exit(code)
+
+
+def serve(socket_path: str | None = None):
+    path = socket_path or default_socket_path()
+    os.environ["MK_HISTORY"] = "0"  # the daemon itself is not a script run
+    _warm_up()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(64)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # workers are reaped automatically
+    Console.write(f"mk daemon: listening on {path} (pid {os.getpid()})")
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                request, fds = _receive_request(conn)
+            except (OSError, ValueError) as e:
+                Console.write(f"mk daemon: bad request: {e}")
+                conn.close()
+                continue
+
+            if request.get("command") == "stop":
+                conn.close()
+                break
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                _run_worker(conn, fds, request)
+            conn.close()
+            for fd in fds:
+                os.close(fd)
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        Console.write("mk daemon: stopped")
@@ -2,30 +2,98 @@
 # cSpell: words fspath chdir
 
 import os
+import sys
 import abc
 import collections.abc
 import functools
 import shutil
+import re
+import fnmatch
 import pathlib
+import time
+import datetime
+import sqlite3
+import threading
+import json
+import errno
+import stat
+import contextlib
+import itertools
+import mmap
 from io import TextIOBase
 from enum import Enum
-from typing import Callable, Any
+from typing import Callable, Any, NamedTuple
 
 from .runner import Runner
 from .to_string_builder import ReprBuilderMixin, ToStringBuilder
-from .console import Console
+from .console import Console, ConsoleStyle
 from ._internal import int_die
+from .cache import cached
+from .trash import Trash
 
 
+_UNSET: Any = object()
+
+_POSIX_SEP = os.sep == "/" and os.altsep is None
+
+
+def _is_normalized(p: str) -> bool:
+    """
+    Cheap conservative check that expanduser() and normpath() would not change [p]:
+    no "~" or "." at the start, no empty components, no trailing separator.
+    Components starting with a dot (".git") take the slow path, that is fine.
+    """
+    if not p or not _POSIX_SEP:
+        return False
+    if p == "/":
+        return True
+    return p[0] not in "~." and p[-1] != "/" and "/." not in p and "//" not in p
+
+
+def _is_plain_name(name) -> bool:
+    """A single path component that can be appended to a normalized path as is"""
+    return (
+        type(name) is str  # pylint: disable=unidiomatic-typecheck
+        and name not in ("", ".", "..")
+        and "/" not in name
+        and not name.startswith("~")
+        and _POSIX_SEP
+    )
+
+
+@functools.total_ordering
 class Path:
+    # the derived components are cached, see _reset_cache()
+    __slots__ = ("_path", "_parent", "_base_name")
+
     def __init__(self, path):
         # p = self._path_from_object(path);
         # p = os.path.expanduser(p);
         # p = os.path.normpath(p);
-        p = os.path.normpath(os.path.expanduser(self._path_from_object(path)))
-        if not p:
-            raise Exception("Path cannot be empty")
+        if isinstance(path, Path):
+            p = path._path
+        elif type(path) is str and _is_normalized(path):  # pylint: disable=unidiomatic-typecheck
+            p = path
+        else:
+            p = os.path.normpath(os.path.expanduser(self._path_from_object(path)))
+            if not p:
+                raise Exception("Path cannot be empty")
         self._path = str(p)
+        self._parent = _UNSET
+        self._base_name = None
+
+    @classmethod
+    def _from_normalized(cls, p: str) -> "Path":
+        """[p] is known to be normalized already, e.g. derived from a normalized path"""
+        result = object.__new__(cls)
+        result._path = p
+        result._parent = _UNSET
+        result._base_name = None
+        return result
+
+    def _reset_cache(self):
+        self._parent = _UNSET
+        self._base_name = None
 
     # accepting almost everything path-like
     @staticmethod
@@ -60,32 +128,53 @@ class Path:
                 path2 = path2[len(os.sep) :]
         return os.path.join(path1, path2)
 
-    # def __lt__(self, other): # + @functools.total_ordering gives full comparison
-    #     return self._path < other._path
+    def __lt__(self, other):
+        if not isinstance(other, Path):
+            return NotImplemented
+        return self._path < other._path
 
     def __eq__(self, other):
+        if not isinstance(other, Path):
+            return NotImplemented
         return self._path == other._path
 
     def __ne__(self, other):
+        if not isinstance(other, Path):
+            return NotImplemented
         return self._path != other._path
 
+    def __hash__(self):
+        # NB: do not mutate (+=, set_extension()) a path used as a dict key or a set member
+        return hash(self._path)
+
     def __repr__(self):
         return (
             f"[{self._path}]"  # using [ ] enables cmd+click in VS Code while < > not.
         )
 
     def __add__(self, other):
+        if _is_plain_name(other) and self._path != ".":
+            sep = "" if self._path.endswith("/") else "/"
+            return Path._from_normalized(self._path + sep + other)
         return Path([self._path, other])
 
     def __iadd__(self, other):
-        self._path = Path([self._path, other])._path
+        self._path = (self + other)._path
+        self._reset_cache()
         return self
 
     def __copy__(self):
-        return Path(self._path)
+        return Path._from_normalized(self._path)
 
     def __deepcopy__(self, memo):
-        return Path(self._path)
+        return Path._from_normalized(self._path)
+
+    def __getstate__(self):
+        return self._path
+
+    def __setstate__(self, state):
+        self._path = state
+        self._reset_cache()
 
     # os.PathLike implementation
     def __fspath__(self) -> str:
@@ -124,10 +213,15 @@ class Path:
         """
         Returns the parent path as a Path object, or None if this is the root.
         """
-        p = os.path.dirname(self._path)
-        if p == self._path:  # not sure if if fully platform independent
-            return None
-        return Path(p)
+        if self._parent is _UNSET:
+            p = os.path.dirname(self._path)
+            if p == self._path:  # not sure if if fully platform independent
+                self._parent = None
+            elif p == "":
+                self._parent = Path._from_normalized(".")  # a relative single component, as normpath("") gives
+            else:
+                self._parent = Path._from_normalized(p)
+        return self._parent
 
     def get_parent(self, level: int = 1) -> "Path | None":
         result = self
@@ -139,7 +233,9 @@ class Path:
     @property
     def base_name(self) -> str:
         """Base path name: filename.ext"""
-        return str(os.path.basename(self._path))
+        if self._base_name is None:
+            self._base_name = str(os.path.basename(self._path))
+        return self._base_name
 
     def relative(self, level: int = 0) -> "Path":
         """
@@ -155,12 +251,15 @@ class Path:
                 components.insert(0, parent.base_name)
                 level -= 1
                 parent = parent.parent
+        names = [c for c in components if c]  # the root base name is empty
+        if names and all(_is_plain_name(n) for n in names):
+            return Path._from_normalized("/".join(names))
         return Path(components)
 
     @property
     def file_name(self) -> str:
         """File name without extension"""
-        return str(os.path.splitext(os.path.basename(self._path))[0])
+        return str(os.path.splitext(self.base_name)[0])
 
     @property
     def extension(self) -> str:
@@ -176,6 +275,7 @@ class Path:
         p, e = os.path.splitext(self._path)
         if e != extension:
             self._path = p + extension
+            self._reset_cache()
         return self
 
     def ensure_exists(self) -> "Path":
@@ -216,22 +316,31 @@ class FSEntry(ReprBuilderMixin, metaclass=abc.ABCMeta):
     def is_system(self):
         pass
 
-    def remove(self, missing_ok=True):
-
+    def remove(self, missing_ok=True, background=False):
+        """
+        [background]: a directory is renamed into a trash directory of its volume and deleted by background threads,
+        so removing a large build tree costs a rename; what is left at the Script exit goes to a detached process.
+        """
         p = self.path
-        if not p.exists:
+        try:
+            st = os.lstat(p.fspath)
+        except FileNotFoundError:
             if missing_ok:
                 return
             int_die(f"{self}: unable to remove (does not exist")
+        except Exception as e:
+            int_die(f"{self}: unable to remove: {e}")
 
-        if p.exists_as_file or p.exists_as_link:
+        if stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
             try:
                 os.unlink(p.fspath)
                 return
             except Exception as e:
                 int_die(f"{self}: unable to remove: {e}")
 
-        if p.exists_as_directory:
+        if stat.S_ISDIR(st.st_mode):
+            if background and Trash.discard(p.fspath):
+                return
             try:
                 shutil.rmtree(p.fspath)
                 return
@@ -241,6 +350,25 @@ class FSEntry(ReprBuilderMixin, metaclass=abc.ABCMeta):
         int_die(f"{self}: unable to remove: not a file, link or directory")
 
 
+_SYSTEM_FILE_NAMES = frozenset([".ds_store"])
+
+
+def _thread_pool(workers: int, name: str):
+    # concurrent.futures loads logging, about 10 ms that every `import mk` would pay
+    from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _read_umask()  # once, os.umask() cannot read it without changing it for the other threads
+
+
 class FileMode(Enum):
     READ = 1
     WRITE = 2
@@ -260,8 +388,8 @@ class File(FSEntry):
         super().configure_repr_builder(sb)
         sb.add("mode", self._mode)
 
-    def read_all(self):
-        f = open(self.path.fspath, "r") or int_die(
+    def read_all(self, encoding: str | None = None):
+        f = open(self.path.fspath, "r", encoding=encoding) or int_die(
             f"{self}: Unable to open file for reading"
         )
         result = f.read()
@@ -301,6 +429,46 @@ class File(FSEntry):
         else:
             int_die(f"{self}: unable to write to, the file is not opened for writing")
 
+    @contextlib.contextmanager
+    def atomic_writer(
+        self,
+        encoding: str | None = "utf-8",
+        buffer_size: int = -1,
+        fsync: bool = False,
+        newline: str | None = None,
+    ):
+        """
+        with File(p).atomic_writer() as f: ... writes to a temporary file next to this one and replaces it
+        on success only, so readers never see a partial content and a failure leaves the old file intact.
+        [encoding]: None opens the temporary file in binary mode.
+        [fsync]: also flushes the data and the rename to the disk, for the files that must survive a power loss.
+        The mode of the replaced file is kept, a symbolic link keeps pointing to it; a hard linked file is rewritten in place.
+        """
+        try:
+            atomic_file = _AtomicFile(self.path.fspath, encoding, buffer_size, newline)
+        except Exception as e:
+            int_die(f"{self}: Unable to open file for writing: {e}")
+        try:
+            yield atomic_file.file
+        except BaseException:
+            atomic_file.discard()
+            raise
+        atomic_file.commit(fsync)
+
+    def write_bytes(self, data, fsync: bool = False):
+        """Replaces the content atomically, see atomic_writer()"""
+        try:
+            with self.atomic_writer(encoding=None, buffer_size=0, fsync=fsync) as f:
+                view = memoryview(data)
+                while view:
+                    view = view[f.write(view) :]
+        except Exception as e:
+            int_die(f"{self}: Unable to write: {e}")
+
+    def write_text(self, text: str, encoding: str = "utf-8", fsync: bool = False):
+        """Replaces the content atomically, encoded at once instead of going through a text stream"""
+        self.write_bytes(text.encode(encoding), fsync=fsync)
+
     def ensure_exists(self):
         if self.path.exists:
             if self.path.exists_as_file:
@@ -308,11 +476,19 @@ class File(FSEntry):
             int_die(f"{self}: the entry exists in file system but it is not a file")
         int_die(f"{self}: does not exist")
 
-    def copy_to(self, destination: os.PathLike, log: bool = False):
+    def copy_to(self, destination: os.PathLike, log: bool = False, strategy: str = "auto") -> str:
+        """
+        Copies the content and the mode bits, as shutil.copy() does; [destination] may be a directory.
+        [strategy]: "reflink" (a copy-on-write clone: FICLONE on Linux, clonefile() on macOS), "copy_file_range",
+        "sendfile" or "buffered"; "auto" tries them in this order. Returns the strategy used.
+        """
         try:
             if log:
                 Console.write(f"{self}: copying to {destination}")
-            shutil.copy(self.path.fspath, destination)
+            dst = os.fspath(destination)
+            if os.path.isdir(dst):
+                dst = os.path.join(dst, self.path.base_name)
+            return _copy_file(self.path.fspath, dst, strategy)
         except Exception as e:
             int_die(f"{self}: Unable to copy myself to {destination}: {e}")
 
@@ -324,6 +500,42 @@ class File(FSEntry):
         except Exception as e:
             int_die(f"{self}: Unable to move myself to {destination}: {e}")
 
+    def digest(self, algo: str = "sha256", use_cache: bool = True) -> str:
+        """
+        Hex digest of the content (any hashlib algorithm: "sha256", "blake2b", ...), read in large chunks.
+        [use_cache]: digests are kept in the user cache keyed by (device, inode, size, mtime),
+        so an unchanged file is never read again.
+        """
+        try:
+            return _file_digest(self.path.fspath, algo, use_cache)
+        except Exception as e:
+            int_die(f"{self}: unable to compute the {algo} digest: {e}")
+
+    def search(self, pattern, flags: int = 0) -> tuple[int, int] | None:
+        """
+        The (start, end) byte offsets of the first match of [pattern] (a bytes or str regex, str is UTF-8 encoded),
+        None if there is none. The file is memory mapped, never loaded, so this works on multi-GB build logs.
+        """
+        return next(self.finditer(pattern, flags), None)
+
+    def finditer(self, pattern, flags: int = 0, overlap: int = 64 * 1024):
+        """
+        Yields the (start, end) byte offsets of the matches of [pattern], in constant memory.
+        Special files (pipes, /proc, ...) are scanned in chunks instead; there a match must fit in [overlap] bytes.
+        """
+        regex = _bytes_regex(pattern, flags)
+        try:
+            yield from _finditer_file(self.path.fspath, regex, overlap)
+        except Exception as e:
+            int_die(f"{self}: Unable to search for {regex.pattern!r}: {e}")
+
+    def count_lines(self) -> int:
+        """The number of lines, the last one counts even without a trailing newline"""
+        try:
+            return _count_lines(self.path.fspath)
+        except Exception as e:
+            int_die(f"{self}: Unable to count the lines: {e}")
+
     def patch(self, f: Callable[[int, str], str]):
         lines = self.read_all().split("\n")
         outlines = []
@@ -331,15 +543,342 @@ class File(FSEntry):
             patched_line = f(idx, line)
             if patched_line is not None:
                 outlines.append(patched_line)
+        if outlines == lines:
+            return  # keep the mtime, incremental builds rely on it
         dest = self  # File(self.path.fspath + ".b")
-        dest.open_for_writing()
-        dest.write("\n".join(outlines))
-        dest.close()
+        dest.write_text("\n".join(outlines))
 
     @property
     def is_system(self):
-        name = self.path.base_name.lower()
-        return name in [".ds_store"]
+        return self.path.base_name.lower() in _SYSTEM_FILE_NAMES
+
+
+_DIGEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    algo TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (dev, inode, algo)
+);
+"""
+
+_DIGEST_CHUNK_SIZE = 1024 * 1024  # hashlib releases the GIL on large updates, so the threads hash in parallel
+
+
+class _DigestStore:
+    """The digest sidecar database in the user cache, shared by the threads of the process"""
+
+    _db: sqlite3.Connection | None = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, st: os.stat_result, algo: str) -> str | None:
+        with cls._lock:
+            row = cls._connect().execute(
+                "SELECT digest FROM digests WHERE dev = ? AND inode = ? AND algo = ? AND size = ? AND mtime_ns = ?",
+                (st.st_dev, st.st_ino, algo, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    @classmethod
+    def set(cls, st: os.stat_result, algo: str, digest: str):
+        with cls._lock:
+            cls._connect().execute(
+                "INSERT OR REPLACE INTO digests (dev, inode, algo, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, algo, st.st_size, st.st_mtime_ns, digest),
+            )
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        # called under the lock
+        if cls._db is None:
+            path = (Directory.user_cache().path + "digests.sqlite").fspath
+            db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_DIGEST_SCHEMA)
+            cls._db = db
+        return cls._db
+
+
+def _file_digest(path: str, algo: str, use_cache: bool) -> str:
+    with open(path, "rb", buffering=0) as f:
+        st = os.fstat(f.fileno())
+        if use_cache:
+            digest = _DigestStore.get(st, algo)
+            if digest is not None:
+                return digest
+        import hashlib  # pylint: disable=import-outside-toplevel
+
+        h = hashlib.new(algo)
+        buffer = bytearray(min(_DIGEST_CHUNK_SIZE, max(st.st_size, 1)))
+        view = memoryview(buffer)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+        digest = h.hexdigest()
+        # not cached if the file was modified while being read
+        if use_cache and os.fstat(f.fileno()).st_mtime_ns == st.st_mtime_ns:
+            _DigestStore.set(st, algo, digest)
+        return digest
+
+
+_SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+def _bytes_regex(pattern, flags: int) -> re.Pattern:
+    if isinstance(pattern, re.Pattern):
+        if isinstance(pattern.pattern, bytes):
+            return pattern
+        return re.compile(pattern.pattern.encode("utf-8"), (pattern.flags & ~re.UNICODE) | flags)
+    if isinstance(pattern, str):
+        pattern = pattern.encode("utf-8")
+    return re.compile(pattern, flags)
+
+
+def _finditer_file(path: str, regex: re.Pattern, overlap: int):
+    with open(path, "rb", buffering=0) as f:
+        st = os.fstat(f.fileno())
+        mapped = None
+        if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                pass  # e.g. a file system without mmap support, scanned in chunks
+        if mapped is not None:
+            with mapped:
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                for m in regex.finditer(mapped):
+                    yield m.start(), m.end()
+            return
+        yield from _finditer_chunks(f, regex, overlap)
+
+
+def _finditer_chunks(f, regex: re.Pattern, overlap: int):
+    """
+    The matches ending in the last [overlap] bytes of the window are deferred to the next one,
+    where more data may extend them; the window keeps at most [overlap] bytes of its tail.
+    """
+    window = b""
+    offset = 0  # of the window in the file
+    eof = False
+    while not eof:
+        chunk = f.read(_SCAN_CHUNK_SIZE)
+        eof = not chunk
+        window += chunk
+        limit = len(window) if eof else len(window) - overlap
+        keep = max(0, limit)
+        for m in regex.finditer(window):
+            if m.end() > limit or (m.start() == m.end() == limit and not eof):
+                keep = min(keep, m.start())
+                break
+            yield offset + m.start(), offset + m.end()
+            keep = max(keep, m.end())
+        window = window[keep:]
+        offset += keep
+
+
+def _count_lines(path: str) -> int:
+    count = 0
+    last = b"\n"
+    with open(path, "rb", buffering=0) as f:
+        buffer = bytearray(_SCAN_CHUNK_SIZE)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            count += (buffer if n == len(buffer) else buffer[:n]).count(b"\n")
+            last = buffer[n - 1 : n]
+    return count + (last != b"\n")
+
+
+_COPY_STRATEGIES = ["reflink", "copy_file_range", "sendfile", "buffered"]
+_COPY_BUFFER_SIZE = 1024 * 1024
+_FICLONE = 0x40049409  # <linux/fs.h>
+# the kernel or the file system cannot do it, try the next strategy
+_COPY_FALLBACK_ERRNOS = frozenset(
+    [errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP]
+)
+
+
+class _AtomicFile:
+    """
+    A temporary file next to [path] that replaces it on commit(). A symbolic link is kept, its target is replaced;
+    a hard linked file is rewritten in place instead (not atomic), replacing it would break the link.
+    """
+
+    def __init__(self, path: str, encoding: str | None, buffer_size: int = -1, newline: str | None = None):
+        # next to the link target: the rename must stay in its directory (and file system)
+        self.path = os.path.realpath(path)
+        self.directory = os.path.dirname(self.path)
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        fd, self.tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(self.path)}.", suffix=".tmp", dir=self.directory)
+        try:
+            if encoding is None:
+                self.file = open(fd, "wb", buffering=buffer_size)
+            else:
+                self.file = open(fd, "w", buffering=buffer_size, encoding=encoding, newline=newline)
+        except BaseException:
+            os.close(fd)
+            os.unlink(self.tmp_path)
+            raise
+
+    def commit(self, fsync: bool = False):
+        try:
+            with self.file:
+                self.file.flush()
+                if fsync:
+                    os.fsync(self.file.fileno())
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                st = None
+            if st is not None and st.st_nlink > 1:
+                shutil.copyfile(self.tmp_path, self.path)
+                os.unlink(self.tmp_path)
+                if fsync:
+                    with open(self.path, "rb") as f:
+                        os.fsync(f.fileno())
+                return
+            os.chmod(self.tmp_path, stat.S_IMODE(st.st_mode) if st is not None else 0o666 & ~_UMASK)
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.discard()
+            raise
+        if fsync:
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def discard(self):
+        with contextlib.suppress(OSError):
+            self.file.close()
+        with contextlib.suppress(OSError):
+            os.unlink(self.tmp_path)
+
+
+class _Clonefile:
+    """macOS clonefile(2), loaded on first use"""
+
+    _function: Any = None
+
+    @classmethod
+    def get(cls):
+        if cls._function is None:
+            cls._function = False
+            if sys.platform == "darwin":
+                import ctypes  # pylint: disable=import-outside-toplevel
+
+                libc = ctypes.CDLL("libc.dylib", use_errno=True)
+                if hasattr(libc, "clonefile"):
+                    libc.clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32]
+                    cls._function = libc.clonefile
+        return cls._function
+
+
+def _copy_data(src_fd: int, dst_fd: int, size: int, strategy: str):
+    """Raises OSError with one of _COPY_FALLBACK_ERRNOS (or AttributeError) if [strategy] is not supported"""
+    if strategy == "reflink":
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    elif strategy == "copy_file_range":
+        copied = 0
+        while copied < size or size == 0:
+            n = os.copy_file_range(src_fd, dst_fd, max(size - copied, _COPY_BUFFER_SIZE))
+            if n == 0:
+                break
+            copied += n
+    elif strategy == "sendfile":
+        offset = 0
+        while True:
+            n = os.sendfile(dst_fd, src_fd, offset, max(size - offset, _COPY_BUFFER_SIZE))
+            if n == 0:
+                break
+            offset += n
+    else:
+        buffer = bytearray(_COPY_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = os.readv(src_fd, [buffer])
+            if n == 0:
+                break
+            written = 0
+            while written < n:
+                written += os.write(dst_fd, view[written:n])
+
+
+def _copy_file(src: str, dst: str, strategy: str = "auto", preserve_times: bool = False) -> str:
+    """Copies a regular file with its mode bits (and times if [preserve_times]); returns the strategy used"""
+    strategies = _COPY_STRATEGIES if strategy == "auto" else [strategy]
+    if strategy not in _COPY_STRATEGIES and strategy != "auto":
+        raise ValueError(f"unknown copy strategy {strategy}")
+    st = os.stat(src)
+    try:
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        pass
+    else:
+        # opening the destination would truncate the source, as shutil.copy() does, refuse
+        if (dst_st.st_dev, dst_st.st_ino) == (st.st_dev, st.st_ino):
+            raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+
+    used = None
+    clonefile = _Clonefile.get() if "reflink" in strategies else None
+    if clonefile:
+        # macOS clones a whole file with its metadata, the destination must not exist
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        if clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0:
+            used = "reflink"
+        elif strategy != "auto":
+            raise OSError(_ctypes_errno(), f"clonefile() failed: {os.strerror(_ctypes_errno())}")
+        strategies = [s for s in strategies if s != "reflink"]
+
+    if used is None:
+        src_fd = os.open(src, os.O_RDONLY)
+        try:
+            dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                for candidate in strategies:
+                    try:
+                        _copy_data(src_fd, dst_fd, st.st_size, candidate)
+                        used = candidate
+                        break
+                    except AttributeError:
+                        pass  # os.copy_file_range/sendfile are not available on this platform
+                    except OSError as e:
+                        if e.errno not in _COPY_FALLBACK_ERRNOS or candidate == strategies[-1]:
+                            raise
+                    # a partial attempt must not leave data behind
+                    os.ftruncate(dst_fd, 0)
+                    os.lseek(src_fd, 0, os.SEEK_SET)
+                    os.lseek(dst_fd, 0, os.SEEK_SET)
+                if used is None:
+                    raise OSError(errno.ENOTSUP, f"copy strategy {strategy} is not supported here")
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+    os.chmod(dst, stat.S_IMODE(st.st_mode))
+    if preserve_times:
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return used
+
+
+def _ctypes_errno() -> int:
+    import ctypes  # pylint: disable=import-outside-toplevel
+
+    return ctypes.get_errno()
 
 
 class TraversedFile:
@@ -351,6 +890,132 @@ class TraversedFile:
         return f"{self.__class__.__name__}({self.path})"
 
 
+def _scan_prefix_length(root: str) -> int:
+    """
+    Length of the prefix to cut from the os.fspath() of an iter() entry to get its path relative to [root]:
+    the scandir paths are root joined with the names ("./a.txt" for "."), their Path may be normalized ("a.txt")
+    """
+    return len(os.path.join(root, ""))
+
+
+class DirectoryEntry:
+    """
+    A lightweight entry yielded by Directory.iter(): wraps os.DirEntry, so the type and the stat info
+    from the directory scan are reused. The Path and the File/Directory objects are created on demand.
+    """
+
+    __slots__ = ("_entry", "_path", "depth")
+
+    def __init__(self, entry: os.DirEntry, depth: int, trusted_path: bool):
+        self._entry = entry
+        self._path = Path._from_normalized(entry.path) if trusted_path else None
+        self.depth = depth
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path})"
+
+    # os.PathLike implementation
+    def __fspath__(self) -> str:
+        return self._entry.path
+
+    @property
+    def name(self) -> str:
+        return self._entry.name
+
+    @property
+    def path(self) -> Path:
+        if self._path is None:
+            self._path = Path(self._entry.path)
+        return self._path
+
+    @property
+    def is_directory(self) -> bool:
+        """Symbolic links to directories are directories, but never descended into"""
+        return self._entry.is_dir()
+
+    @property
+    def is_file(self) -> bool:
+        return self._entry.is_file()
+
+    @property
+    def is_link(self) -> bool:
+        return self._entry.is_symlink()
+
+    @property
+    def is_system(self) -> bool:
+        return not self._entry.is_dir() and self._entry.name.lower() in _SYSTEM_FILE_NAMES
+
+    def stat(self) -> os.stat_result:
+        """lstat() result, cached"""
+        return self._entry.stat(follow_symlinks=False)
+
+    @property
+    def fs_entry(self) -> FSEntry:
+        return Directory(self.path) if self.is_directory else File(self.path)
+
+
+class _WalkFilter:
+    """The filters of Directory.iter() and iter_parallel(), see there"""
+
+    def __init__(self, pattern, extensions, predicate, prune, files, directories, skip_system_objects):
+        self.pattern_re = re.compile(fnmatch.translate(pattern)) if pattern is not None else None
+        self.extensions = frozenset(extensions) if extensions is not None else None
+        self.predicate = predicate
+        if prune is None or callable(prune):
+            self.prune_names, self.prune_predicate = frozenset(), prune
+        else:
+            self.prune_names, self.prune_predicate = frozenset(prune), None
+        self.files = files
+        self.directories = directories
+        self.skip_system_objects = skip_system_objects
+
+    def is_selected(self, entry: DirectoryEntry, is_dir: bool) -> bool:
+        if not (self.directories if is_dir else self.files):
+            return False
+        if self.skip_system_objects and not is_dir and entry.name.lower() in _SYSTEM_FILE_NAMES:
+            return False
+        if self.pattern_re is not None and self.pattern_re.match(entry.name) is None:
+            return False
+        if self.extensions is not None and os.path.splitext(entry.name)[1] not in self.extensions:
+            return False
+        return self.predicate is None or self.predicate(entry)
+
+    def scan(self, path: str, depth: int, trusted_path: bool, sort: bool, max_depth: int | None):
+        """
+        One directory: the selected entries, directories first, and the subdirectories to descend into.
+        Raises OSError if the directory cannot be listed.
+        """
+        dir_entries = []
+        file_entries = []
+        with os.scandir(path) as scan:
+            for os_entry in scan:
+                try:
+                    is_dir = os_entry.is_dir()
+                except OSError:
+                    is_dir = False
+                (dir_entries if is_dir else file_entries).append(os_entry)
+        if sort:
+            dir_entries.sort(key=lambda e: e.name)
+            file_entries.sort(key=lambda e: e.name)
+
+        entries = []
+        subdirectories = []
+        descend = max_depth is None or depth < max_depth
+        for os_entry in dir_entries:
+            entry = DirectoryEntry(os_entry, depth, trusted_path)
+            if os_entry.name in self.prune_names or (self.prune_predicate is not None and self.prune_predicate(entry)):
+                continue
+            if self.is_selected(entry, True):
+                entries.append(entry)
+            if descend and not os_entry.is_symlink():
+                subdirectories.append(os_entry.path)
+        for os_entry in file_entries:
+            entry = DirectoryEntry(os_entry, depth, trusted_path)
+            if self.is_selected(entry, False):
+                entries.append(entry)
+        return entries, subdirectories
+
+
 class Directory(FSEntry):
 
     def __init__(self, path, must_exist: bool = False, create_if_needed: bool = True):
@@ -387,6 +1052,441 @@ class Directory(FSEntry):
     def is_system(self):
         return False
 
+    @staticmethod
+    def user_cache(subpath=None) -> "Directory":
+        """
+        Per-user cache directory of the library (~/Library/Caches/mk on macOS, $XDG_CACHE_HOME/mk or ~/.cache/mk otherwise).
+        Created if needed.
+        """
+        if sys.platform == "darwin":
+            root = Path("~/Library/Caches")
+        else:
+            root = Path(os.environ.get("XDG_CACHE_HOME") or "~/.cache")
+        return Directory([root, "mk", subpath]).ensure_exists()
+
+    def iter(
+        self,
+        pattern: str | None = None,
+        extensions=None,
+        predicate: Callable[[DirectoryEntry], bool] | None = None,
+        prune=None,
+        max_depth: int | None = None,
+        files: bool = True,
+        directories: bool = True,
+        skip_system_objects: bool = True,
+        sort: bool = False,
+    ):
+        """
+        Streams the directory contents as DirectoryEntry objects, top-down: the entries of a directory first,
+        then its subdirectories contents, the same order as os.walk().
+        [pattern]: fnmatch-style pattern of the entry name, e.g. "*.dart".
+        [extensions]: extensions with a dot, e.g. [".png", ".jpg"].
+        [predicate]: any other filter.
+        The filters select the yielded entries only, the walk still descends into filtered out directories.
+        [prune]: directory names (e.g. [".git", "build"]) or a predicate; matching directories are not
+            yielded nor descended into.
+        [max_depth]: 0 lists the direct children only, None is unlimited.
+        [sort]: sorts the names in each directory; regardless of the flag directories are listed first.
+        Unreadable subdirectories are skipped.
+        """
+        walk_filter = _WalkFilter(pattern, extensions, predicate, prune, files, directories, skip_system_objects)
+        root = self.path.fspath
+        trusted_path = _POSIX_SEP and root != "."
+        stack = [(root, 0)]
+        while stack:
+            path, depth = stack.pop()
+            try:
+                entries, subdirectories = walk_filter.scan(path, depth, trusted_path, sort, max_depth)
+            except OSError as e:
+                if path is root:
+                    int_die(f"{self}: unable to list the directory: {e}")
+                continue
+            yield from entries
+            stack.extend((p, depth + 1) for p in reversed(subdirectories))
+
+    def iter_parallel(
+        self,
+        pattern: str | None = None,
+        extensions=None,
+        predicate: Callable[[DirectoryEntry], bool] | None = None,
+        prune=None,
+        max_depth: int | None = None,
+        files: bool = True,
+        directories: bool = True,
+        skip_system_objects: bool = True,
+        ordered: bool = False,
+        workers: int = 8,
+    ):
+        """
+        Directory.iter() that scans the directories on a thread pool, for huge trees on slow
+        (network, virtualized) volumes where the walk is latency-bound. The filters are the same,
+        [predicate] and [prune] callables are called from the worker threads.
+        [ordered]: yields exactly what iter(sort=True) does, in the same order; the workers still scan ahead.
+        Otherwise the directories are yielded as soon as they are scanned.
+        On a local disk with warm caches the walk is CPU-bound and iter() is faster.
+        """
+        walk_filter = _WalkFilter(pattern, extensions, predicate, prune, files, directories, skip_system_objects)
+        root = self.path.fspath
+        trusted_path = _POSIX_SEP and root != "."
+
+        def scan(path, depth):
+            return walk_filter.scan(path, depth, trusted_path, ordered, max_depth), depth
+
+        executor = _thread_pool(workers, "mk-walk")
+        try:
+            root_future = executor.submit(scan, root, 0)
+            try:
+                root_future.result()
+            except OSError as e:
+                int_die(f"{self}: unable to list the directory: {e}")
+
+            def results(future):
+                try:
+                    return future.result()
+                except OSError:
+                    return ([], []), 0  # unreadable subdirectories are skipped
+
+            if ordered:
+                # depth-first over futures: the consumer follows the iter() order, the pool runs ahead of it
+                stack = [root_future]
+                while stack:
+                    (entries, subdirectories), depth = results(stack.pop())
+                    yield from entries
+                    stack.extend(executor.submit(scan, p, depth + 1) for p in subdirectories[::-1])
+            else:
+                import queue  # pylint: disable=import-outside-toplevel
+
+                done: queue.SimpleQueue = queue.SimpleQueue()
+                root_future.add_done_callback(done.put)
+                outstanding = 1
+                while outstanding:
+                    (entries, subdirectories), depth = results(done.get())
+                    outstanding -= 1
+                    for p in subdirectories:
+                        executor.submit(scan, p, depth + 1).add_done_callback(done.put)
+                        outstanding += 1
+                    yield from entries
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def total_size(self, workers: int = 8, use_cache: bool = True) -> int:
+        """
+        Disk usage of the whole tree in bytes (allocated blocks where the platform reports them), counted on a thread pool.
+        [use_cache]: the total is cached in the user cache and reused while the directory itself is unchanged (its
+        mtime and size), which is reliable for write-once trees such as archives but misses deep changes.
+        """
+        if use_cache:
+            return _cached_tree_size(self.path.fspath, workers)
+        return _tree_size(self.path.fspath, workers)
+
+    def digest_many(
+        self,
+        pattern: str | None = None,
+        extensions=None,
+        prune=None,
+        algo: str = "sha256",
+        workers: int = 8,
+        use_cache: bool = True,
+    ) -> dict[Path, str]:
+        """Digests of all the files of the tree matching the filters (see iter()), computed on a thread pool"""
+        paths = [e.path for e in self.iter(pattern=pattern, extensions=extensions, prune=prune, directories=False)]
+        try:
+            with _thread_pool(workers, "mk-digest") as executor:
+                digests = executor.map(lambda p: _file_digest(p.fspath, algo, use_cache), paths)
+                return dict(zip(paths, digests))
+        except Exception as e:
+            int_die(f"{self}: unable to compute the {algo} digests: {e}")
+
+    def snapshot(
+        self,
+        algo: str | None = None,
+        pattern: str | None = None,
+        extensions=None,
+        prune=None,
+        workers: int = 8,
+    ) -> "Snapshot":
+        """
+        Manifest of the tree (see iter() for the filters): relative path, type, size and mtime of every entry.
+        [algo]: also the file digests (see File.digest(), the digest cache makes repeated snapshots cheap).
+        """
+        root = self.path.fspath
+        prefix_length = _scan_prefix_length(root)
+        entries = list(self.iter(pattern=pattern, extensions=extensions, prune=prune, skip_system_objects=False))
+        digests = [None] * len(entries)
+        if algo is not None:
+            files = [i for i, e in enumerate(entries) if e.is_file and not e.is_link]
+            with _thread_pool(workers, "mk-snapshot") as executor:
+                for i, digest in zip(files, executor.map(lambda i: _file_digest(entries[i].path.fspath, algo, True), files)):
+                    digests[i] = digest
+
+        snapshot = Snapshot(root, algo)
+        for e, digest in zip(entries, digests):
+            st = e.stat()
+            kind = "l" if e.is_link else "d" if e.is_directory else "f"
+            relative = os.fspath(e)[prefix_length:]
+            snapshot.entries[relative] = SnapshotEntry(relative, kind, st.st_size, st.st_mtime_ns, digest)
+        return snapshot
+
+    def copy_to(
+        self,
+        destination,
+        workers: int = 8,
+        hardlink: bool = False,
+        strategy: str = "auto",
+        dirs_exist_ok: bool = False,
+        log: bool = False,
+    ):
+        """
+        Copies the tree to [destination] (which becomes the copy, as with shutil.copytree()), the files on a thread
+        pool with File.copy_to() strategies. Symbolic links are recreated as links; modes and times are preserved.
+        [hardlink]: hard links the files instead of copying them when on the same volume (the copies then share
+        the content, do not modify them in place).
+        """
+        src_root = self.path.fspath
+        dst_root = Path(destination).fspath
+        if log:
+            Console.write(f"{self}: copying to {dst_root}")
+        try:
+            os.makedirs(dst_root, exist_ok=dirs_exist_ok)
+            directories = [(src_root, dst_root)]
+            files = []
+            prefix_length = _scan_prefix_length(src_root)
+            for e in self.iter(skip_system_objects=False):
+                src = e.path.fspath
+                dst = os.path.join(dst_root, os.fspath(e)[prefix_length:])
+                if e.is_link:
+                    if os.path.lexists(dst):
+                        os.unlink(dst)
+                    os.symlink(os.readlink(src), dst)
+                elif e.is_directory:
+                    os.makedirs(dst, exist_ok=dirs_exist_ok)
+                    directories.append((src, dst))
+                else:
+                    files.append((src, dst))
+
+            def copy(pair):
+                src, dst = pair
+                if hardlink:
+                    try:
+                        if os.path.lexists(dst):
+                            os.unlink(dst)
+                        os.link(src, dst)
+                        return
+                    except OSError as e:
+                        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                            raise
+                _copy_file(src, dst, strategy, preserve_times=True)
+
+            with _thread_pool(workers, "mk-copy") as executor:
+                for _ in executor.map(copy, files):
+                    pass
+
+            # the directory metadata last, adding the files has changed the times
+            for src, dst in reversed(directories):
+                st = os.stat(src)
+                os.chmod(dst, stat.S_IMODE(st.st_mode))
+                os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        except Exception as e:
+            int_die(f"{self}: Unable to copy myself to {dst_root}: {e}")
+        return Directory(dst_root)
+
+    def sync_to(
+        self,
+        destination,
+        delete: bool = True,
+        compare: str = "mtime+size",
+        workers: int = 8,
+        strategy: str = "auto",
+        dry_run: bool = False,
+        log: bool = True,
+    ) -> "SyncReport":
+        """
+        Mirrors the tree to [destination], rsync-like: copies new and changed files only (see copy_to() for how),
+        fixes the modes and times of unchanged ones and, if [delete], removes the entries missing in the source.
+        [compare]: "mtime+size", or "hash" (File.digest(), cached) to skip files with an identical content.
+        [dry_run]: only plans, the report tells what would be done.
+        """
+        assert compare in ("mtime+size", "hash")
+        src_root = self.path.fspath
+        dst_root = Path(destination).fspath
+        report = SyncReport(self, Directory(dst_root), dry_run)
+        try:
+            src_entries = _relative_entries(self)
+            dst_entries = _relative_entries(Directory(dst_root)) if os.path.isdir(dst_root) else {}
+
+            directories = []  # (src stat, dst path)
+            copies = []  # (relative, size)
+            for relative, e in src_entries.items():
+                st = e.stat()
+                d = dst_entries.get(relative)
+                d_st = d.stat() if d is not None else None
+                kind = _entry_kind(e)
+                if d is not None and _entry_kind(d) != kind:
+                    report.deleted.append(relative)  # replaced by another kind of entry
+                    d = None
+                if kind == "d":
+                    directories.append((st, relative, d is None))
+                elif kind == "l":
+                    if d is None or os.readlink(e.path.fspath) != os.readlink(d.path.fspath):
+                        report.copied.append(relative)
+                        copies.append((relative, 0))
+                elif d is None or not _is_same_file(e, d, st, d_st, compare):
+                    report.copied.append(relative)
+                    report.bytes_transferred += st.st_size
+                    copies.append((relative, st.st_size))
+                else:
+                    report.bytes_skipped += st.st_size
+                    if stat.S_IMODE(st.st_mode) != stat.S_IMODE(d_st.st_mode) or st.st_mtime_ns != d_st.st_mtime_ns:
+                        report.updated.append(relative)
+
+            if delete:
+                # the removed directories, the replaced ones included; a parent is always listed before its children
+                removed_dirs = {r for r in report.deleted if _entry_kind(dst_entries[r]) == "d"}
+                for relative in sorted(set(dst_entries) - set(src_entries)):
+                    is_directory = _entry_kind(dst_entries[relative]) == "d"
+                    if os.path.dirname(relative) in removed_dirs:
+                        if is_directory:
+                            removed_dirs.add(relative)
+                        continue  # removed with its directory
+                    report.deleted.append(relative)
+                    if is_directory:
+                        removed_dirs.add(relative)
+
+            if dry_run:
+                if log:
+                    report.write()
+                return report
+
+            # the replaced entries and the extras first, so the new ones can take their place
+            for relative in report.deleted:
+                p = os.path.join(dst_root, relative)
+                if os.path.isdir(p) and not os.path.islink(p):
+                    shutil.rmtree(p)
+                elif os.path.lexists(p):
+                    os.unlink(p)
+            os.makedirs(dst_root, exist_ok=True)
+            for _, relative, is_new in directories:
+                if is_new or not os.path.isdir(os.path.join(dst_root, relative)):
+                    os.makedirs(os.path.join(dst_root, relative), exist_ok=True)
+
+            def copy(item):
+                relative, _ = item
+                src = os.path.join(src_root, relative)
+                dst = os.path.join(dst_root, relative)
+                if os.path.islink(src):
+                    if os.path.lexists(dst):
+                        os.unlink(dst)
+                    os.symlink(os.readlink(src), dst)
+                else:
+                    _copy_file(src, dst, strategy, preserve_times=True)
+
+            with _thread_pool(workers, "mk-sync") as executor:
+                for _ in executor.map(copy, copies):
+                    pass
+
+            for relative in report.updated:
+                st = src_entries[relative].stat()
+                dst = os.path.join(dst_root, relative)
+                os.chmod(dst, stat.S_IMODE(st.st_mode))
+                os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+            # the directory metadata last, the changes inside have updated the times
+            for st, relative, _ in reversed(directories):
+                dst = os.path.join(dst_root, relative)
+                os.chmod(dst, stat.S_IMODE(st.st_mode))
+                os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        except Exception as e:
+            int_die(f"{self}: Unable to sync to {dst_root}: {e}")
+        if log:
+            report.write()
+        return report
+
+    def patch_files(
+        self,
+        glob,
+        rules,
+        workers: int = 8,
+        prune=None,
+        encoding: str = "utf-8",
+        dry_run: bool = False,
+        log: bool = True,
+    ) -> dict[Path, int]:
+        """
+        Applies regex [rules] line by line to the files of the tree matching [glob], on a thread pool.
+        [glob]: an fnmatch-style pattern (or a list) of the file name, e.g. "*.yaml", or of the relative path
+            if it has a separator, e.g. "ios/*/Info.plist".
+        [rules]: PatchRule objects, (pattern, replacement) pairs or a {pattern: replacement} dict;
+            the replacement is a re.sub() template or a callable taking the match.
+        Files are streamed into an atomic temporary file; unchanged files are never written, so their mtimes
+        (and the incremental builds) are kept. Returns the changed files with their replacement counts.
+        """
+        globs = [glob] if isinstance(glob, str) else list(glob)
+        compiled = _compile_patch_rules(rules)
+        prefix_length = _scan_prefix_length(self.path.fspath)
+
+        def matches(entry: DirectoryEntry) -> bool:
+            relative = os.fspath(entry)[prefix_length:]
+            return any(fnmatch.fnmatch(relative if os.sep in g else entry.name, g) for g in globs)
+
+        entries = []
+        targets = set()
+        for e in self.iter(predicate=matches, prune=prune, directories=False):
+            try:
+                st = os.stat(e)
+            except FileNotFoundError:
+                continue  # a dangling link
+            # a link and its target (or two hard links) would be patched by two threads at once
+            target = (st.st_dev, st.st_ino)
+            if stat.S_ISREG(st.st_mode) and target not in targets:
+                targets.add(target)
+                entries.append(e)
+        paths = [e.path for e in entries]
+
+        def patch(p: Path):
+            try:
+                return _patch_file(p.fspath, compiled, encoding, dry_run)
+            except Exception as e:  # reported on the calling thread
+                return e
+
+        with _thread_pool(workers, "mk-patch") as executor:
+            counts = list(executor.map(patch, paths))
+        for e, n in zip(entries, counts):
+            if isinstance(n, Exception):
+                int_die(f"{self}: Unable to patch {os.fspath(e)[prefix_length:]}: {n}")
+        changed = {p: n for p, n in zip(paths, counts) if n}
+        if log:
+            verb = "would patch" if dry_run else "patched"
+            Console.write(f"{self}: {verb} {len(changed)} of {len(paths)} file(s)")
+            for e, n in zip(entries, counts):
+                if n:
+                    Console.write(f"  {os.fspath(e)[prefix_length:]}: {n} replacement(s)")
+        return changed
+
+    def watch(
+        self,
+        callback,
+        recursive: bool = True,
+        debounce_ms: int = 300,
+        filters=None,
+        prune=None,
+        backend: str = "auto",
+        poll_interval: float = 1.0,
+    ):
+        """
+        Watches the tree for file changes and calls [callback] with a ChangeSet (added/modified/removed paths)
+        once the changes settle for [debounce_ms], so a burst of copied files is one batch.
+        [filters]: fnmatch-style file name patterns, e.g. ["*.png", "*.jpg"]. [prune]: directory names to ignore.
+        [backend]: "inotify" (Linux), "poll" (Directory.snapshot() diffs every [poll_interval] seconds) or "auto".
+        Returns the started Watcher: the callback runs on its thread; stop() it or wait() for Ctrl+C.
+        """
+        from .watch import Watcher  # pylint: disable=import-outside-toplevel
+
+        self.path.ensure_exists_as_directory()
+        return Watcher(self.path.fspath, callback, recursive, debounce_ms, filters, prune, backend, poll_interval)
+
+    def apply_retention(self, policy: "RetentionPolicy", protect=None, dry_run: bool = False, log: bool = True):
+        """Applies [policy] to the direct children of the directory, see RetentionPolicy"""
+        return policy.apply(self, protect=protect, dry_run=dry_run, log=log)
+
     def list(
         self, skip_system_objects=True, sort=False, recursive=True
     ) -> list[FSEntry]:
@@ -395,48 +1495,386 @@ class Directory(FSEntry):
         If recursive is True, list the contents of the directory recursively.
         If sort is True, sort directory and file names. Regardless of the flag directories are listed first.
         If skip_system_objects is True, skip system objects.
+        A recursive listing of a missing directory is empty, as with os.walk(); a non-recursive one dies.
         """
+        if recursive and not self.path.exists_as_directory:
+            return []
         try:
-            result = []
-
-            if recursive:
-                for dir_name, dirnames, filenames in os.walk(self.path):
-                    if sort:
-                        dirnames = sorted(dirnames)
-                    for d in dirnames:
-                        result.append(Directory([dir_name, d]))
-                    if sort:
-                        filenames = sorted(filenames)
-                    for f in filenames:
-                        file = File([dir_name, f])
-                        if not skip_system_objects or not file.is_system:
-                            result.append(file)
-                return result
-            else:
-                dirs = []
-                files = []
-                for entry in os.listdir(self.path):
-                    p = self.path + entry
-                    if p.exists_as_directory:
-                        dirs.append(entry)
-                    else:
-                        files.append(entry)
-                if sort:
-                    dirs = sorted(dirs)
-                    files = sorted(files)
-
-                for d in dirs:
-                    result.append(Directory(self.path + d))
-                for f in files:
-                    file = File(self.path + f)
-                    if not skip_system_objects or not file.is_system:
-                        result.append(file)
-                return result
-
+            return [
+                e.fs_entry
+                for e in self.iter(
+                    max_depth=None if recursive else 0,
+                    skip_system_objects=skip_system_objects,
+                    sort=sort,
+                )
+            ]
         except Exception as e:
             int_die(f"{self}: unable to list the directory: {e}")
 
     def traverse(self, TraversedFileClass=TraversedFile):
-        for root, d, files in os.walk(self.path):
-            for file in files:
-                yield TraversedFileClass(Path([root, file]))
+        for entry in self.iter(directories=False, skip_system_objects=False):
+            yield TraversedFileClass(entry.path)
+
+
+class PatchRule:
+    def __init__(self, pattern, replacement, flags: int = 0, count: int = 0):
+        """[count]: the maximum number of replacements per line, all if 0"""
+        self.regex = re.compile(pattern, flags) if isinstance(pattern, str) else pattern
+        self.replacement = replacement
+        self.count = count
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.regex.pattern!r} -> {self.replacement!r})"
+
+
+def _compile_patch_rules(rules) -> list[PatchRule]:
+    if isinstance(rules, dict):
+        rules = list(rules.items())
+    return [r if isinstance(r, PatchRule) else PatchRule(*r) for r in rules]
+
+
+def _patch_file(path: str, rules: list[PatchRule], encoding: str, dry_run: bool) -> int:
+    """
+    Returns the number of replacements. The temporary file is created on the first change only,
+    the unchanged lines before it are then copied from a second reader, so nothing is kept in memory.
+    """
+    replacements = 0
+    atomic_file = None
+    try:
+        with open(path, "r", encoding=encoding, newline="") as f:
+            for index, line in enumerate(f):
+                for rule in rules:
+                    line, n = rule.regex.subn(rule.replacement, line, count=rule.count)
+                    replacements += n
+                if atomic_file is not None:
+                    atomic_file.file.write(line)
+                elif replacements and not dry_run:
+                    atomic_file = _AtomicFile(path, encoding, newline="")
+                    with open(path, "r", encoding=encoding, newline="") as unchanged:
+                        atomic_file.file.writelines(itertools.islice(unchanged, index))
+                    atomic_file.file.write(line)
+        if atomic_file is not None:
+            atomic_file.commit()
+    except UnicodeDecodeError:
+        if atomic_file is not None:
+            atomic_file.discard()
+        Console.write(f"{path}: not a {encoding} text file, not patched", style=ConsoleStyle.WARNING)
+        return 0
+    except BaseException:
+        if atomic_file is not None:
+            atomic_file.discard()
+        raise
+    return replacements
+
+
+def _relative_entries(directory: Directory) -> dict[str, DirectoryEntry]:
+    prefix_length = _scan_prefix_length(directory.path.fspath)
+    return {os.fspath(e)[prefix_length:]: e for e in directory.iter(skip_system_objects=False)}
+
+
+def _entry_kind(e: DirectoryEntry) -> str:
+    return "l" if e.is_link else "d" if e.is_directory else "f"
+
+
+def _is_same_file(src: DirectoryEntry, dst: DirectoryEntry, src_st, dst_st, compare: str) -> bool:
+    if src_st.st_size != dst_st.st_size:
+        return False
+    if compare == "hash":
+        return _file_digest(src.path.fspath, "sha256", True) == _file_digest(dst.path.fspath, "sha256", True)
+    return src_st.st_mtime_ns == dst_st.st_mtime_ns
+
+
+class SyncReport(ReprBuilderMixin):
+    def __init__(self, source: Directory, destination: Directory, dry_run: bool):
+        self.source = source
+        self.destination = destination
+        self.dry_run = dry_run
+        self.copied: list[str] = []  # relative paths, new or changed
+        self.updated: list[str] = []  # the same content, the mode or times fixed
+        self.deleted: list[str] = []
+        self.bytes_transferred = 0
+        self.bytes_skipped = 0
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.add_value(self.destination.path)
+        sb.add("copied", len(self.copied))
+        sb.add("updated", len(self.updated))
+        sb.add("deleted", len(self.deleted))
+        sb.add("bytes_transferred", self.bytes_transferred)
+        sb.add("bytes_skipped", self.bytes_skipped)
+        sb.add("dry_run", self.dry_run)
+
+    def write(self):
+        mib = 1024 * 1024
+        prefix = "would sync" if self.dry_run else "synced"
+        Console.write(
+            f"{self.source}: {prefix} to {self.destination.path}: {len(self.copied)} copied "
+            f"({self.bytes_transferred / mib:,.1f} MiB), {self.bytes_skipped / mib:,.1f} MiB skipped, "
+            f"{len(self.updated)} updated, {len(self.deleted)} deleted"
+        )
+
+
+def _entry_size(st: os.stat_result) -> int:
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def _tree_size(path: str, workers: int) -> int:
+    return sum(
+        _entry_size(e.stat()) for e in Directory(path).iter_parallel(skip_system_objects=False, workers=workers)
+    )
+
+
+@cached(key=lambda path, workers: path, depends_on_files=lambda path, workers: [path], max_entries=10000)
+def _cached_tree_size(path: str, workers: int) -> int:
+    return _tree_size(path, workers)
+
+
+def _default_retention_group(name: str) -> str:
+    # app-prod-release-1.2.3+45.xcarchive -> app-prod-release.xcarchive, see the Flutter builds naming
+    stem, extension = os.path.splitext(name)
+    return re.sub(r"-\d[\w.+]*$", "", stem) + extension
+
+
+class RetentionItem(ReprBuilderMixin):
+    def __init__(self, entry: DirectoryEntry, size: int, group: str):
+        st = entry.stat()
+        self.entry = entry
+        self.size = size
+        self.group = group
+        self.mtime = st.st_mtime
+        self.atime = st.st_atime
+        self.reason: str | None = None  # why it is removed
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.add_value(self.entry.path)
+        sb.add("size", self.size)
+        sb.add("reason", self.reason)
+
+
+class RetentionReport(ReprBuilderMixin):
+    def __init__(self, directory: Directory, dry_run: bool):
+        self.directory = directory
+        self.dry_run = dry_run
+        self.kept: list[RetentionItem] = []
+        self.removed: list[RetentionItem] = []
+
+    @property
+    def bytes_kept(self) -> int:
+        return sum(i.size for i in self.kept)
+
+    @property
+    def bytes_removed(self) -> int:
+        return sum(i.size for i in self.removed)
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.add_value(self.directory.path)
+        sb.add("kept", len(self.kept))
+        sb.add("removed", len(self.removed))
+        sb.add("bytes_removed", self.bytes_removed)
+        sb.add("dry_run", self.dry_run)
+
+    def write(self):
+        verb = "would remove" if self.dry_run else "removed"
+        mib = 1024 * 1024
+        Console.write(
+            f"{self.directory}: retention {verb} {len(self.removed)} item(s), {self.bytes_removed / mib:,.1f} MiB; "
+            f"kept {len(self.kept)}, {self.bytes_kept / mib:,.1f} MiB"
+        )
+        for item in self.removed:
+            Console.write(f"  - {item.entry.name} ({item.size / mib:,.1f} MiB): {item.reason}")
+
+
+class RetentionPolicy:
+    """
+    Retention of build artifacts: the direct children of a directory (archives, APKs, export directories).
+    [pattern]: fnmatch-style pattern of the managed names, e.g. "*.xcarchive"; all the children if None.
+    [keep_last]: keep the N most recent (by mtime) artifacts of each group.
+    [group_by]: maps a name to its group; by default the version suffix is dropped, so app-prod-release-1.2.3+4.apk
+        and app-prod-release-1.2.4+5.apk are one group (one per flavor and build mode).
+    [max_age]: seconds or a timedelta; older artifacts are removed.
+    [max_total_bytes]: the least recently used (by [lru_by]: "atime" or "mtime") artifacts are removed
+        until the total fits.
+    [use_cache]: reuse the cached directory sizes, see Directory.total_size(); off by default, a stale size
+        (a tree modified below its top directory) would make the wrong artifacts removed.
+    Applied in that order; the [protect]ed paths given to apply() are never removed.
+    """
+
+    def __init__(
+        self,
+        pattern: str | None = None,
+        keep_last: int | None = None,
+        group_by: Callable[[str], str] | None = None,
+        max_age: datetime.timedelta | float | None = None,
+        max_total_bytes: int | None = None,
+        lru_by: str = "atime",
+        workers: int = 8,
+        use_cache: bool = False,
+    ):
+        assert lru_by in ("atime", "mtime")
+        self.pattern = pattern
+        self.keep_last = keep_last
+        self.group_by = group_by or _default_retention_group
+        self.max_age = max_age.total_seconds() if isinstance(max_age, datetime.timedelta) else max_age
+        self.max_total_bytes = max_total_bytes
+        self.lru_by = lru_by
+        self.workers = workers
+        self.use_cache = use_cache
+
+    def _size(self, entry: DirectoryEntry) -> int:
+        if entry.is_directory and not entry.is_link:
+            return Directory(entry.path).total_size(workers=self.workers, use_cache=self.use_cache)
+        return _entry_size(entry.stat())
+
+    def plan(self, directory: Directory, protect=None, dry_run: bool = True) -> RetentionReport:
+        protected = {Path(p) for p in (protect or []) if p is not None}
+        report = RetentionReport(directory, dry_run)
+        if not directory.path.exists_as_directory:
+            return report
+        entries = list(directory.iter(pattern=self.pattern, max_depth=0, skip_system_objects=True))
+        with _thread_pool(self.workers, "mk-retention") as executor:
+            sizes = list(executor.map(self._size, entries))
+        items = [RetentionItem(e, size, self.group_by(e.name)) for e, size in zip(entries, sizes)]
+        candidates = [i for i in items if i.entry.path not in protected]
+
+        def remove(item: RetentionItem, reason: str):
+            item.reason = reason
+            candidates.remove(item)
+            report.removed.append(item)
+
+        if self.max_age is not None:
+            now = time.time()
+            for item in [i for i in candidates if now - i.mtime > self.max_age]:
+                remove(item, f"older than {self.max_age / 86400:g} day(s)")
+
+        if self.keep_last is not None:
+            groups: dict[str, list[RetentionItem]] = {}
+            for item in items:
+                if item.reason is None:
+                    groups.setdefault(item.group, []).append(item)
+            for group, group_items in groups.items():
+                group_items.sort(key=lambda i: i.mtime, reverse=True)
+                for item in group_items[self.keep_last :]:
+                    if item in candidates:
+                        remove(item, f"not in the last {self.keep_last} of {group}")
+
+        if self.max_total_bytes is not None:
+            total = sum(i.size for i in items if i.reason is None)
+            for item in sorted(candidates, key=lambda i: getattr(i, self.lru_by)):
+                if total <= self.max_total_bytes:
+                    break
+                remove(item, f"total above {self.max_total_bytes / 1024 / 1024:,.1f} MiB, least recently used")
+                total -= item.size
+
+        report.kept = [i for i in items if i.reason is None]
+        return report
+
+    def apply(self, directory: Directory, protect=None, dry_run: bool = False, log: bool = True) -> RetentionReport:
+        report = self.plan(directory, protect=protect, dry_run=dry_run)
+        if not dry_run:
+            for item in report.removed:
+                item.entry.fs_entry.remove()
+        if log and (report.removed or dry_run):
+            report.write()
+        return report
+
+
+class SnapshotEntry(NamedTuple):
+    path: str  # relative to the snapshot root
+    kind: str  # "f"ile, "d"irectory or "l"ink
+    size: int
+    mtime_ns: int
+    digest: str | None
+
+    def is_modified(self, other: "SnapshotEntry") -> bool:
+        if self.kind != other.kind:
+            return True
+        if self.kind == "d":
+            return False  # the contents changes are reported on their own
+        if self.size != other.size:
+            return True
+        if self.digest is not None and other.digest is not None:
+            return self.digest != other.digest  # a touched but identical file is not modified
+        return self.mtime_ns != other.mtime_ns
+
+
+class SnapshotDiff(ReprBuilderMixin):
+    def __init__(self, added: list[str], removed: list[str], modified: list[str]):
+        self.added = added
+        self.removed = removed
+        self.modified = modified
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.add("added", len(self.added))
+        sb.add("removed", len(self.removed))
+        sb.add("modified", len(self.modified))
+
+
+class Snapshot(ReprBuilderMixin):
+    """
+    A directory manifest made by Directory.snapshot(). Stored as JSON lines: a header line, then one
+    [path, kind, size, mtime_ns, digest] array per entry.
+    """
+
+    _FORMAT_VERSION = 1
+
+    def __init__(self, root: str, algo: str | None = None):
+        self.root = root
+        self.algo = algo
+        self.entries: dict[str, SnapshotEntry] = {}
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.add_value(self.root)
+        sb.add("entries", len(self.entries))
+        sb.add("algo", self.algo)
+
+    def diff(self, other: "Snapshot") -> SnapshotDiff:
+        """What changed from this (older) snapshot to [other]; relative paths, sorted"""
+        added = [p for p in other.entries if p not in self.entries]
+        removed = [p for p in self.entries if p not in other.entries]
+        modified = [
+            p for p, e in self.entries.items() if p in other.entries and e.is_modified(other.entries[p])
+        ]
+        return SnapshotDiff(sorted(added), sorted(removed), sorted(modified))
+
+    def save(self, path):
+        """Written atomically, so a reader never sees a partial manifest"""
+        p = Path(path)
+        tmp_path = f"{p.fspath}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                header = {"version": self._FORMAT_VERSION, "root": self.root, "algo": self.algo}
+                f.write(json.dumps(header) + "\n")
+                for e in self.entries.values():
+                    f.write(json.dumps(list(e), ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, p.fspath)
+        except Exception as e:
+            int_die(f"{p}: unable to save the snapshot: {e}")
+
+    @classmethod
+    def load(cls, path, missing_ok: bool = False) -> "Snapshot | None":
+        p = Path(path)
+        try:
+            with open(p.fspath, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get("version") != cls._FORMAT_VERSION:
+                    raise Exception(f"unsupported version {header.get('version')}")
+                snapshot = cls(header["root"], header["algo"])
+                for line in f:
+                    e = SnapshotEntry(*json.loads(line))
+                    snapshot.entries[e.path] = e
+                return snapshot
+        except FileNotFoundError:
+            if missing_ok:
+                return None
+            int_die(f"{p}: the snapshot does not exist")
+        except Exception as e:
+            int_die(f"{p}: unable to load the snapshot: {e}")
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# cSpell: words sqlite
+
+# Local run history: one row per script run and one per Runner execution, in an SQLite database in the user cache.
+# Disabled by MK_HISTORY=0. Query it with RunHistory.step_stats() or from the command line:
+#   python -m mk.tools.history [SCRIPT] [--last N] [--threshold 1.2]
+
+import os
+import json
+import time
+import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    script TEXT NOT NULL,
+    args TEXT NOT NULL,
+    exit_reason TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_script ON runs (script, id);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    seq INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    argv_hash TEXT NOT NULL,
+    exit_code INTEGER,
+    duration_ns INTEGER NOT NULL,
+    titled INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS steps_run ON steps (run_id);
+"""
+
+
+def _percentile(values: list, p: float):
+    s = sorted(values)
+    return s[min(int(round(p * (len(s) - 1))), len(s) - 1)]
+
+
+class StepStats:
+    def __init__(self, title: str, durations_ns: list[int], in_latest_run: bool):
+        """
+        [durations_ns]: one per run containing the step (the sum if it ran several times), ordered from the latest run.
+        [in_latest_run]: the first duration is the latest run one, last_ns is None otherwise.
+        """
+        self.title = title
+        self.runs = len(durations_ns)
+        self.last_ns = durations_ns[0] if in_latest_run else None
+        self.p50_ns = _percentile(durations_ns, 0.5)
+        self.p95_ns = _percentile(durations_ns, 0.95)
+        previous = durations_ns[1:] if in_latest_run else durations_ns
+        self.previous_p50_ns = _percentile(previous, 0.5) if previous else None
+
+    def is_regression(self, threshold: float) -> bool:
+        """The step of the latest run is slower than [threshold] times the median of the previous runs"""
+        return self.last_ns is not None and self.previous_p50_ns is not None and self.last_ns > self.previous_p50_ns * threshold
+
+
+class RunHistory:
+    _steps = []  # (title, argv_hash, exit_code, duration_ns) of the current run
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.environ.get("MK_HISTORY", "1") != "0"
+
+    @staticmethod
+    def database_path() -> str:
+        from .fs import Directory  # pylint: disable=import-outside-toplevel # fs -> runner -> history
+
+        return (Directory.user_cache().path + "history.sqlite").fspath
+
+    @classmethod
+    def _connect(cls, path: str | None = None) -> sqlite3.Connection:
+        db = sqlite3.connect(path or cls.database_path(), timeout=30)
+        db.executescript(_SCHEMA)
+        if "titled" not in {row[1] for row in db.execute("PRAGMA table_info(steps)")}:
+            try:
+                # databases of the previous versions: their untitled steps have the command line as title
+                db.execute("ALTER TABLE steps ADD COLUMN titled INTEGER NOT NULL DEFAULT 1")
+            except sqlite3.OperationalError:
+                pass  # added by another process meanwhile
+        return db
+
+    @classmethod
+    def record_step(cls, title: str | None, argv: str, exit_code: int | None, duration_ns: int):
+        """An untitled step is shown as its command line and identified by its hash"""
+        import hashlib  # pylint: disable=import-outside-toplevel
+
+        argv_hash = hashlib.sha1(argv.encode("utf-8")).hexdigest()[:16]
+        cls._steps.append((title if title is not None else argv, argv_hash, exit_code, duration_ns, int(title is not None)))
+
+    @classmethod
+    def record_run(cls, script: str, args: list[str], exit_reason: str, duration_ns: int):
+        """Writes the run with the steps recorded so far in one transaction"""
+        steps, cls._steps = cls._steps, []
+        db = cls._connect()
+        try:
+            with db:
+                cursor = db.execute(
+                    "INSERT INTO runs (script, args, exit_reason, started_at, duration_ns) VALUES (?, ?, ?, ?, ?)",
+                    (script, json.dumps(args), exit_reason, time.time() - duration_ns / 1e9, duration_ns),
+                )
+                run_id = cursor.lastrowid
+                db.executemany(
+                    "INSERT INTO steps (run_id, seq, title, argv_hash, exit_code, duration_ns, titled) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, seq) + step for seq, step in enumerate(steps)],
+                )
+        finally:
+            db.close()
+
+    @classmethod
+    def step_stats(cls, script: str, last_runs: int = 20, path: str | None = None) -> list[StepStats]:
+        """
+        Per-step duration statistics over the last [last_runs] runs of [script]. The whole run is the '<total>' step.
+        A step is identified by its title, or by its command line hash if untitled.
+        """
+        db = cls._connect(path)
+        try:
+            runs = db.execute(
+                "SELECT id, duration_ns FROM runs WHERE script = ? ORDER BY id DESC LIMIT ?", (script, last_runs)
+            ).fetchall()
+            if not runs:
+                return []
+            placeholders = ",".join("?" * len(runs))
+            rows = db.execute(
+                f"SELECT run_id, title, argv_hash, titled, duration_ns FROM steps WHERE run_id IN ({placeholders})"
+                " ORDER BY run_id DESC, seq",
+                [run_id for run_id, _ in runs],
+            ).fetchall()
+        finally:
+            db.close()
+        latest_run_id = runs[0][0]
+        titles = {"<total>": "<total>"}
+        # step -> run id -> duration, the runs in the latest first order
+        durations = {"<total>": {run_id: d for run_id, d in runs}}
+        for run_id, title, argv_hash, titled, duration_ns in rows:
+            step = title if titled else f"#{argv_hash}"
+            titles.setdefault(step, title)
+            per_run = durations.setdefault(step, {})
+            per_run[run_id] = per_run.get(run_id, 0) + duration_ns
+        return [
+            StepStats(titles[step], list(per_run.values()), latest_run_id in per_run) for step, per_run in durations.items()
+        ]
+
+    @classmethod
+    def scripts(cls, path: str | None = None) -> list[str]:
+        db = cls._connect(path)
+        try:
+            return [r[0] for r in db.execute("SELECT DISTINCT script FROM runs ORDER BY script").fetchall()]
+        finally:
+            db.close()
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# cSpell: words textfile fcntl
+
+import os
+import math
+import json
+import contextlib
+from .time_utils import TimeCounter
+
+DEFAULT_DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, math.inf)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.samples = {}  # label values tuple -> value
+
+    def _label_values(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise Exception(f"Metric {self.name}: labels {sorted(labels)} do not match {list(self.label_names)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def _format_labels(self, values, extra=None) -> str:
+        pairs = list(zip(self.label_names, values)) + (extra or [])
+        if not pairs:
+            return ""
+        escaped = [(n, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for n, v in pairs]
+        return "{" + ",".join(f'{n}="{v}"' for n, v in escaped) + "}"
+
+    def merge_sample(self, values: tuple, value):
+        raise NotImplementedError()
+
+    def format_samples(self) -> list[str]:
+        return [f"{self.name}{self._format_labels(values)} {_format_number(v)}" for values, v in self.samples.items()]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        values = self._label_values(labels)
+        self.samples[values] = self.samples.get(values, 0) + value
+
+    def merge_sample(self, values, value):
+        self.samples[values] = self.samples.get(values, 0) + value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        self.samples[self._label_values(labels)] = value
+
+    def merge_sample(self, values, value):
+        self.samples[values] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=DEFAULT_DURATION_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, value: float, **labels):
+        self.merge_sample(self._label_values(labels), self._single(value))
+
+    def _single(self, value: float) -> list:
+        return [[1 if value <= b else 0 for b in self.buckets], value, 1]
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block in seconds"""
+        t = TimeCounter()
+        try:
+            yield
+        finally:
+            self.observe(t.elapsed_duration.ns / 1e9, **labels)
+
+    def merge_sample(self, values, value):
+        current = self.samples.get(values)
+        if current is None or len(current[0]) != len(value[0]):
+            self.samples[values] = [list(value[0]), value[1], value[2]]
+            return
+        current[0] = [a + b for a, b in zip(current[0], value[0])]
+        current[1] += value[1]
+        current[2] += value[2]
+
+    def format_samples(self) -> list[str]:
+        lines = []
+        for values, (bucket_counts, total, count) in self.samples.items():
+            for b, c in zip(self.buckets, bucket_counts):
+                le = "+Inf" if b == math.inf else _format_number(b)
+                lines.append(f"{self.name}_bucket{self._format_labels(values, [('le', le)])} {c}")
+            lines.append(f"{self.name}_sum{self._format_labels(values)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(values)} {count}")
+        return lines
+
+
+_METRIC_CLASSES = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+def _format_number(v) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _copy_metric(metric: _Metric) -> _Metric:
+    if isinstance(metric, Histogram):
+        return Histogram(metric.name, metric.help_text, metric.label_names, metric.buckets)
+    return type(metric)(metric.name, metric.help_text, metric.label_names)
+
+
+def _is_compatible(a: _Metric, b: _Metric) -> bool:
+    if a.type_name != b.type_name or a.label_names != b.label_names:
+        return False
+    return not isinstance(a, Histogram) or a.buckets == b.buckets  # type: ignore[attr-defined]
+
+
+def _format(metrics) -> str:
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines += metric.format_samples()
+    return "\n".join(lines) + "\n"
+
+
+class Metrics:
+    """
+    Process metrics registry. With MK_METRICS_TEXTFILE=<path>.prom (or Metrics.enable_textfile()), Runner and Script
+    metrics are recorded automatically and, at exit, written as a node_exporter textfile.
+    Counters and histograms accumulate across runs in a <path>.state.json sidecar.
+    """
+
+    _metrics: dict[str, _Metric] = {}
+    _textfile_path: str | None = None
+
+    @classmethod
+    def _get(cls, metric_class, name, help_text, label_names, **kwargs):
+        metric = cls._metrics.get(name)
+        if metric is None:
+            metric = metric_class(name, help_text, label_names, **kwargs)
+            cls._metrics[name] = metric
+        elif not isinstance(metric, metric_class):
+            raise Exception(f"Metric {name} is already registered as a {metric.type_name}")
+        return metric
+
+    @classmethod
+    def counter(cls, name: str, help_text: str, label_names=()) -> Counter:
+        return cls._get(Counter, name, help_text, label_names)
+
+    @classmethod
+    def gauge(cls, name: str, help_text: str, label_names=()) -> Gauge:
+        return cls._get(Gauge, name, help_text, label_names)
+
+    @classmethod
+    def histogram(cls, name: str, help_text: str, label_names=(), buckets=DEFAULT_DURATION_BUCKETS) -> Histogram:
+        return cls._get(Histogram, name, help_text, label_names, buckets=buckets)
+
+    @classmethod
+    def enable_textfile(cls, path):
+        cls._textfile_path = os.fspath(path)
+
+    @classmethod
+    def enable_from_environment(cls):
+        path = os.environ.get("MK_METRICS_TEXTFILE")
+        if path:
+            cls.enable_textfile(path)
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls._textfile_path is not None
+
+    @classmethod
+    def format(cls) -> str:
+        """The metrics of this run in the Prometheus text exposition format"""
+        return _format(cls._metrics.values())
+
+    @classmethod
+    def write_textfile(cls):
+        """Merges the current run into the accumulated state and rewrites the textfile atomically"""
+        if cls._textfile_path is None:
+            return
+        import fcntl  # pylint: disable=import-outside-toplevel # POSIX only, as node_exporter
+
+        path = cls._textfile_path
+        with open(f"{path}.lock", "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state_path = f"{path}.state.json"
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+            # the accumulated state with the samples of this run merged in
+            merged: dict[str, _Metric] = {}
+            for name, m in state.items():
+                kwargs = {"buckets": [math.inf if b is None else b for b in m["buckets"]]} if "buckets" in m else {}
+                merged[name] = _METRIC_CLASSES[m["type"]](name, m["help"], m["labels"], **kwargs)
+                for values, value in m["samples"]:
+                    merged[name].merge_sample(tuple(values), value)
+            for name, metric in cls._metrics.items():
+                target = merged.get(name)
+                if target is None or not _is_compatible(target, metric):
+                    # new or redefined: the old samples are dropped
+                    target = merged[name] = _copy_metric(metric)
+                for values, value in metric.samples.items():
+                    target.merge_sample(values, value)
+
+            state = {}
+            for name, metric in merged.items():
+                m = {"type": metric.type_name, "help": metric.help_text, "labels": list(metric.label_names)}
+                if isinstance(metric, Histogram):
+                    m["buckets"] = [None if b == math.inf else b for b in metric.buckets]
+                m["samples"] = [[list(values), value] for values, value in metric.samples.items()]
+                state[name] = m
+
+            for file_path, content in [(state_path, json.dumps(state)), (path, _format(merged.values()))]:
+                tmp_path = f"{file_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(tmp_path, file_path)
+
+            # already accounted for, so a later write does not count them twice
+            for metric in cls._metrics.values():
+                metric.samples = {}
@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 # cSpell: words Sosumi pync icns
 
+import os
+import sys
+import abc
+import json
+import shutil
+import subprocess
+import threading
+import time
 from typing import Optional
 from enum import Enum
-import pync
 from .fs import Path
 from .misc import Safe
 
 
-# valid for macOS currently. Copy your sounds to ~/Library/Sounds. I personally use old (prior to BigSur) Sosumi.aiff and Glass.aiff 
+# valid for macOS currently. Copy your sounds to ~/Library/Sounds. I personally use old (prior to BigSur) Sosumi.aiff and Glass.aiff
 class NotificationSound(Enum):
     ERROR = "MKError"
     SUCCESS = "MKSuccess"
@@ -16,14 +23,151 @@ class NotificationSound(Enum):
 
 class NotificationConfig:
     def __init__(
-        self, 
+        self,
         sound: NotificationSound | None = None,
-        icon=None   # ='/Applications/xxx.app/Contents/Resources/yyy.icns',
+        icon=None   # ='/Applications/xxx.app/Contents/Resources/yyy.icns', or a callable returning it
     ):
         self.sound = sound
         self.icon = icon
 
 
+class NotificationBackend(metaclass=abc.ABCMeta):
+    """Delivers a notification. Called from a background thread"""
+
+    @abc.abstractmethod
+    def notify(
+        self,
+        message: str,
+        title: str | None,
+        subtitle: str | None,
+        sound: NotificationSound | None,
+        icon: Path | None,
+    ):
+        pass
+
+
+class NullNotificationBackend(NotificationBackend):
+    def notify(self, message, title, subtitle, sound, icon):
+        pass
+
+
+class PyncNotificationBackend(NotificationBackend):
+    """macOS Notification Center via pync/terminal-notifier"""
+
+    def notify(self, message, title, subtitle, sound, icon):
+        import pync  # pylint: disable=import-outside-toplevel
+
+        args = {}
+        if title is not None:
+            args["title"] = title
+        if subtitle is not None:
+            args["subtitle"] = subtitle
+        if sound is not None:
+            args["sound"] = sound.value
+        if icon is not None:
+            args["appIcon"] = icon.fspath
+        pync.notify(message, **args)
+
+
+class NotifySendNotificationBackend(NotificationBackend):
+    """Linux desktop notifications via notify-send. Sounds are not supported"""
+
+    def notify(self, message, title, subtitle, sound, icon):
+        args = ["notify-send"]
+        if icon is not None:
+            args += ["-i", icon.fspath]
+        summary = Safe.first_available([title, "mk"])
+        body = "\n".join(filter(None, [subtitle, message]))
+        subprocess.run(args + [summary, body], check=False, timeout=10)
+
+
+class WebhookNotificationBackend(NotificationBackend):
+    """POSTs the notification as JSON, e.g. to a chat incoming webhook"""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def notify(self, message, title, subtitle, sound, icon):
+        import urllib.request  # pylint: disable=import-outside-toplevel # pulls http.client, ssl and email
+
+        data = {"title": title, "subtitle": subtitle, "message": message}
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(data).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class Notifications:
+    """
+    Dispatches notifications to the configured backend from background threads, so the caller never waits.
+    The backend is selected by MK_NOTIFICATION_BACKEND (pync, notify-send, webhook, null) or by platform.
+    The webhook backend takes its URL from MK_NOTIFICATION_WEBHOOK_URL.
+    """
+
+    _backend: NotificationBackend | None = None
+    _threads: list[threading.Thread] = []
+
+    @classmethod
+    def set_backend(cls, backend: NotificationBackend):
+        cls._backend = backend
+
+    @classmethod
+    def get_backend(cls) -> NotificationBackend:
+        if cls._backend is None:
+            cls._backend = cls._default_backend()
+        return cls._backend
+
+    @staticmethod
+    def _default_backend() -> NotificationBackend:
+        name = os.environ.get("MK_NOTIFICATION_BACKEND")
+        if name is None:
+            if sys.platform == "darwin":
+                name = "pync"
+            elif shutil.which("notify-send") is not None and os.environ.get("DISPLAY"):
+                name = "notify-send"
+            else:
+                name = "null"
+        if name == "pync":
+            return PyncNotificationBackend()
+        if name == "notify-send":
+            return NotifySendNotificationBackend()
+        if name == "webhook":
+            url = os.environ.get("MK_NOTIFICATION_WEBHOOK_URL")
+            if url:
+                return WebhookNotificationBackend(url)
+        return NullNotificationBackend()
+
+    @classmethod
+    def dispatch(cls, message: str, title=None, subtitle=None, sound=None, icon=None):
+        backend = cls.get_backend()
+        if isinstance(backend, NullNotificationBackend):
+            return
+
+        def deliver():
+            try:
+                backend.notify(message, title, subtitle, sound, icon)
+            except Exception as e:
+                print(f"mk.Notifications: unable to show the notification: {e}", file=sys.stderr)
+
+        cls._threads = [t for t in cls._threads if t.is_alive()]
+        thread = threading.Thread(target=deliver, name="mk-notification", daemon=True)
+        thread.start()
+        cls._threads.append(thread)
+
+    @classmethod
+    def wait(cls, timeout: float = 0.5):
+        """Gives pending notifications up to [timeout] seconds in total, the rest is abandoned"""
+        deadline = time.monotonic() + timeout
+        for thread in cls._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        cls._threads = [t for t in cls._threads if t.is_alive()]
+
+
 def show_notification(
     message: str,
     config: NotificationConfig,
@@ -31,16 +175,12 @@ def show_notification(
     subtitle: str | None = None,
 ):
     sound = Safe.conditional(config, lambda: config.sound)
-    icon = Safe.conditional(config, lambda: config.icon)
-
-    args = {}
-    if title is not None:
-        args["title"] = title
-    if subtitle is not None:
-        args["subtitle"] = subtitle
-    if sound is not None:
-        args["sound"] = sound.value
-    if icon is not None:
-        args["appIcon"] = Path(icon).fspath
-
-    pync.notify(message, **args)
+    icon = Safe.conditional(config, lambda: Safe.resolve_callable(config.icon))
+
+    Notifications.dispatch(
+        message,
+        title=title,
+        subtitle=subtitle,
+        sound=sound,
+        icon=Path(icon) if icon is not None else None,
+    )
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# cSpell: words pstats tracemalloc lineno
+
+import os
+import io
+
+
+class Profiling:
+    """
+    Whole-process CPU (cProfile) and memory (tracemalloc) profiling of a script run.
+    Enabled by MK_PROFILE=cpu|mem|cpu,mem or Script.enable_profiling(). Subscripts run in-process are covered as well.
+    """
+
+    # the profilers are imported on use, they would cost every run of every script
+    _cpu_profile = None  # cProfile.Profile
+    _mem = False
+
+    @classmethod
+    def enable(cls, cpu: bool = True, mem: bool = False):
+        # pylint: disable=import-outside-toplevel
+        import cProfile
+        import tracemalloc
+
+        if cpu and cls._cpu_profile is None:
+            cls._cpu_profile = cProfile.Profile()
+            cls._cpu_profile.enable()
+        if mem and not cls._mem:
+            cls._mem = True
+            tracemalloc.start()
+
+    @classmethod
+    def enable_from_environment(cls):
+        kinds = {k.strip() for k in os.environ.get("MK_PROFILE", "").lower().split(",")}
+        cpu = "cpu" in kinds or "all" in kinds
+        mem = "mem" in kinds or "all" in kinds
+        if cpu or mem:
+            cls.enable(cpu=cpu, mem=mem)
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls._cpu_profile is not None or cls._mem
+
+    @classmethod
+    def finish(cls, base_path: str, top_n: int = 10) -> list[str]:
+        """
+        Stops profiling and writes the reports as [base_path].pstats/.cpu.txt/.mem.txt.
+        Returns short top-[top_n] summaries to show.
+        """
+        # pylint: disable=import-outside-toplevel
+        import pstats
+        import tracemalloc
+
+        summaries = []
+        profile = cls._cpu_profile
+        cls._cpu_profile = None
+        if profile is not None:
+            profile.disable()
+
+        if cls._mem:
+            cls._mem = False
+            # taken first, so the CPU report processing does not show up in it
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats = snapshot.statistics("lineno")
+            header = f"current {current / 1024 / 1024:.1f} MiB, peak {peak / 1024 / 1024:.1f} MiB"
+            with open(f"{base_path}.mem.txt", "w", encoding="utf-8") as f:
+                f.write(header + "\n")
+                for stat in stats[:200]:
+                    f.write(f"{stat}\n")
+            lines = [f"Memory profile: {base_path}.mem.txt, {header}"] + [f"  {stat}" for stat in stats[:top_n]]
+            summaries.append("\n".join(lines))
+
+        if profile is not None:
+            profile.dump_stats(f"{base_path}.pstats")
+            with open(f"{base_path}.cpu.txt", "w", encoding="utf-8") as f:
+                pstats.Stats(profile, stream=f).sort_stats(pstats.SortKey.CUMULATIVE).print_stats()
+            s = io.StringIO()
+            pstats.Stats(profile, stream=s).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+            report = s.getvalue()
+            # skip the pstats preamble, keep the table only
+            table_index = report.find("ncalls")
+            summaries.append(f"CPU profile: {base_path}.pstats\n" + report[max(table_index, 0) :].rstrip())
+
+        return summaries
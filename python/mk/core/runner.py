@@ -6,14 +6,16 @@ import subprocess
 import shlex
 import os
 import re
-from rich.table import Table
-import rich.box
+import contextlib
 
 from .console import Console
 from .time_utils import TimeCounter
 from ._internal import int_die
 from .misc import Safe
 from .to_string_builder import ReprBuilderMixin, ToStringBuilder
+from .trace import Trace
+from .history import RunHistory
+from .metrics import Metrics
 
 
 class RunnerResult(ReprBuilderMixin):
@@ -56,6 +58,9 @@ class Runner:
         self.args = Safe.to_string_list(args)
         self.title = title
         self._table = None
+        self._last_code = None
+        self._last_output_bytes = 0
+        self._observation = None
 
     def set_command(self, command):
         self._command = Safe.to_string_list(command)
@@ -76,6 +81,10 @@ class Runner:
         if value is None:
             return
 
+        # rich is imported on demand to keep `import mk` cheap
+        from rich.table import Table  # pylint: disable=import-outside-toplevel
+        import rich.box  # pylint: disable=import-outside-toplevel
+
         table = self._table
         if table is None:
             table = Table(
@@ -116,7 +125,52 @@ class Runner:
 
         table.add_row(name, expand_value(value))
 
+    @contextlib.contextmanager
+    def _observe(self):
+        """Records the execution in the trace, the run history and the metrics"""
+        cmd = self._full_shell_cmd()
+        self._last_code = None
+        self._last_output_bytes = 0
+        self._observation = (Safe.first_available([self.title, cmd]), cmd, Trace.now_us(), TimeCounter())
+        try:
+            yield
+        finally:
+            self._end_observation()
+
+    def _end_observation(self):
+        """Also called right before dying: the script exit handlers run before the stack unwinds"""
+        if self._observation is None:
+            return
+        name, cmd, start_us, t = self._observation
+        self._observation = None
+        duration_ns = t.elapsed_duration.ns
+        Trace.add_span(name, "runner", start_us, Trace.now_us(), {"cmd": cmd})
+        if RunHistory.is_enabled():
+            RunHistory.record_step(self.title, cmd, self._last_code, duration_ns)
+        if Metrics.is_enabled():
+            title = self._metrics_title()
+            Metrics.histogram(
+                "mk_runner_duration_seconds", "Runner execution time", ["title"]
+            ).observe(duration_ns / 1e9, title=title)
+            Metrics.counter(
+                "mk_runner_runs_total", "Runner executions by exit code", ["title", "code"]
+            ).inc(title=title, code="none" if self._last_code is None else self._last_code)
+            Metrics.counter(
+                "mk_runner_output_bytes_total", "Runner output captured", ["title"]
+            ).inc(self._last_output_bytes, title=title)
+
+    def _metrics_title(self) -> str:
+        """The explicit title or the executable name: the full command line would make an unbounded label set"""
+        if self.title is not None:
+            return self.title
+        words = self._command[0].split(maxsplit=1) if self._command else []
+        return os.path.basename(words[0]) if words else "none"
+
     def run_silent(self, die_on_error: bool = True) -> RunnerResult:
+        with self._observe():
+            return self._run_silent(die_on_error=die_on_error)
+
+    def _run_silent(self, die_on_error: bool) -> RunnerResult:
         cmd = self._full_shell_cmd()
         outputs = []
         p = subprocess.Popen(
@@ -129,10 +183,13 @@ class Runner:
         if p.stdout is not None:
             with p.stdout:
                 for line_b in iter(p.stdout.readline, b""):
+                    self._last_output_bytes += len(line_b)
                     line = line_b.decode("utf-8")
                     outputs.append(line)
         result_code = p.wait()
+        self._last_code = result_code
         if result_code and die_on_error:
+            self._end_observation()
             int_die(
                 f"Executing '{Safe.first_available([self.title, cmd])}' failed with exit code {result_code}."
             )
@@ -148,6 +205,21 @@ class Runner:
         notify_completion: bool = False,
         # the input. Will be converted to UTF8
         input_data: str | None = None,
+    ):
+        with self._observe():
+            return self._run(
+                catch_output=catch_output,
+                display_output=display_output,
+                notify_completion=notify_completion,
+                input_data=input_data,
+            )
+
+    def _run(
+        self,
+        catch_output: bool,
+        display_output: bool,
+        notify_completion: bool,
+        input_data: str | None,
     ):
         t = TimeCounter()
 
@@ -188,6 +260,7 @@ class Runner:
 
             if input_data_b:
                 p_result = p.communicate(input=input_data_b)
+                self._last_output_bytes = len(p_result[0])
                 lines = str(p_result[0].decode("utf-8")).split("\n")
                 for line in lines:
                     Console.write(line.strip(), to_display=display_output)
@@ -197,15 +270,18 @@ class Runner:
                 if p.stdout is not None:
                     with p.stdout:
                         for line_b in iter(p.stdout.readline, b""):
+                            self._last_output_bytes += len(line_b)
                             line = line_b.decode("utf-8")
                             Console.write(line.strip(), to_display=display_output)
                             outputs.append(line)
                             # Console.update_status(f"{status} {t.elapsed_duration}")
 
             result_code = p.wait()
+            self._last_code = result_code
             Console.stop_status()
             Console.write_empty_line()
             if result_code:
+                self._end_observation()
                 int_die(
                     f"Running '{Safe.first_available([self.title, cmd])}' failed with exit code {result_code}."
                 )
@@ -219,7 +295,9 @@ class Runner:
         # run without output catching
         p = subprocess.Popen(cmd, stdin=subprocess.PIPE, shell=True)
         p_result = p.communicate(input=input_data_b)
+        self._last_code = p.returncode
         if p.returncode:
+            self._end_observation()
             int_die(
                 f"Running {Safe.first_available([self.title, cmd])} failed with exit code {p.returncode}"
             )
@@ -4,18 +4,29 @@
 import signal
 import sys
 import atexit
+import contextlib
 import os
 import time
 import re
 import importlib.util
-from typing import NoReturn
-from runpy import run_path
-from rich.rule import Rule
+import pickle
+import subprocess
+import threading
+from typing import Any, Callable, NoReturn
 from .console import Console, ConsoleStyle
-from .notification import NotificationConfig, NotificationSound, show_notification
+from .notification import NotificationConfig, NotificationSound, Notifications, show_notification
 from .fs import Path, Directory
-from .time_utils import TimeCounter
+from .time_utils import DateTime, DateTimeFormat, TimeCounter, script_time_counter
 from .assets import Assets
+from .code_cache import CodeCache
+from .misc import Safe
+from .trace import Trace
+from .checkpoint import CheckpointStore
+from .profiling import Profiling
+from .metrics import Metrics
+from .history import RunHistory
+from .trash import Trash
+from .clipboard import MISSING, UNCHANGED, MemoryClipboardBackend, SQLiteClipboardBackend, default_shared_clipboard_path
 
 # core folder: os.path.realpath(os.path.abspath(os.path.split(inspect.getfile(inspect.currentframe()))[0]))
 # import inspect
@@ -54,6 +65,8 @@ class _StackItem:
         self.path = Path(path)
         self.directory = Directory(self.path.parent)
         self.time_counter = TimeCounter()
+        self.result = None
+        self.has_result = False
 
     @property
     def name(self):
@@ -91,56 +104,125 @@ class _Stack:
 
 
 class ScriptClipboard:
-    """A simple clipboard for sharing data between scripts. Attached to Script class."""
+    """
+    A simple clipboard for sharing data between scripts. Attached to Script class.
+    In-process by default, Script.use_shared_clipboard() makes it shared between processes (and runs).
+    """
 
-    def __init__(self):
-        self._data = {}
+    def __init__(self, backend=None):
+        self._backend = backend if backend is not None else MemoryClipboardBackend()
+
+    @property
+    def backend(self):
+        return self._backend
 
     def __getitem__(self, key: str):
-        return self._data[key]
+        value = self._backend.get(key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
 
     def get(self, key: str):
-        return self._data.get(key)
+        return self._backend.get(key, None)
 
     def __setitem__(self, key: str, value):
-        self._data[key] = value
+        self._backend.set(key, value)
 
     def dump(self):
         print("Script Clipboard: {")
-        for k, v in self._data.items():
+        for k, v in self._backend.items():
             print(f"  {k}: {v}")
         print("}")
 
     def append_to_list(self, key: str, value):
-        if key not in self._data:
-            self._data[key] = []
-        self._data[key].append(value)
+        def append(current):
+            lst = [] if current is MISSING else current
+            lst.append(value)
+            return lst
+
+        self._backend.update(key, append)
 
     def get_list(self, key: str) -> list:
-        if key not in self._data:
-            self._data[key] = []
-        return self._data[key]
+        """The stored list. Note: for a shared clipboard it is a copy, use append_to_list() to modify"""
+        lst = self._backend.get(key)
+        if lst is MISSING:
+            lst = self._backend.update(key, lambda current: [] if current is MISSING else current)
+        return lst
+
+    def compare_and_set(self, key: str, expected, value) -> bool:
+        """Atomically sets [value] if the current one (None if missing) equals [expected]. Returns True if set"""
+        swapped = False
+
+        def cas(current):
+            nonlocal swapped
+            current_value = None if current is MISSING else current
+            if current_value == expected:
+                swapped = True
+                return value
+            return UNCHANGED
+
+        self._backend.update(key, cas)
+        return swapped
 
     def remove(self, key: str):
-        if key in self._data:
-            del self._data[key]
+        self._backend.remove(key)
+
+
+def _exit_status(code) -> int:
+    """The process exit status of SystemExit([code]), as the interpreter maps it"""
+    if code is None:
+        return 0
+    return code if isinstance(code, int) else 1
+
+
+def _is_script_entry_point() -> bool:
+    """The process runs a script file (python script.py), sys.argv is its own"""
+    main = sys.modules.get("__main__")
+    main_file = getattr(main, "__file__", None)
+    if main_file is None or getattr(main, "__spec__", None) is not None or not sys.argv or not sys.argv[0]:
+        return False
+    return os.path.realpath(main_file) == os.path.realpath(sys.argv[0])
 
 
 class Script:
 
     @classmethod
     def _init(cls):
-        cls._stack = _Stack()
-        cls._stack.push(sys.argv[0])
-        # cls.directory = Directory(cls.path.parent)
-        # cls._exit_handlers = []
-        cls._on_exit_called = False
+        cls._init_run()
         # _SignalHandler(signal.SIGINT, lambda: cls._call_exit_handler(ExitReason.SIG_INT)) # will use exception hook for KeyboardInterrupt instead
         _SignalHandler(signal.SIGTERM, cls._on_sig_term)
         atexit.register(cls._on_default_exit)
         cls._original_except_hook = sys.excepthook
         sys.excepthook = cls._except_hook
 
+    @classmethod
+    def _init_run(cls, entry_point: bool | None = None):
+        """
+        Per-run state, based on sys.argv and the environment. Called again by the warm daemon in a forked worker.
+        [entry_point]: sys.argv belongs to the script importing mk, detected if None.
+        """
+        if entry_point is None:
+            entry_point = _is_script_entry_point()
+        # --resume belongs to the library, so hide it from the script own argument parsing; the arguments
+        # of anything else importing mk (python -m pytest, python -c...) are left alone
+        cls.resume = (entry_point and "--resume" in sys.argv[1:]) or os.environ.get("MK_RESUME") == "1"
+        if entry_point:
+            sys.argv[1:] = [a for a in sys.argv[1:] if a != "--resume"]
+        cls._stack = _Stack()
+        cls._stack.push(sys.argv[0])
+        # cls.directory = Directory(cls.path.parent)
+        # cls._exit_handlers = []
+        cls._on_exit_called = False
+        cls._failed = False
+        cls._exit_code = None
+        cls._exit_summary = None
+        cls._checkpoints = None
+        cls.clipboard = ScriptClipboard()
+        script_time_counter.restart()
+        Trace.enable_from_environment()
+        Profiling.enable_from_environment()
+        Metrics.enable_from_environment()
+
     # not needed yet
     # @classmethod
     # def register_exit_handler(cls, handler):
@@ -153,30 +235,41 @@ class Script:
 
     _original_except_hook = None
 
+    _exit_summary: str | None = None
+    # off in the subscript workers: the parent reports their failures in one notification
+    _exit_notifications = True
+
+    resume = False
+    _failed = False
+    # the exit status when known: Script.exit(), or a SystemExit caught by the entry point running the script
+    # (the warm daemon, a subscript worker); None when the script ends by itself or by a plain sys.exit()
+    _exit_code: int | None = None
+    _checkpoints: CheckpointStore | None = None
+
     exception_exit_action_config = ExitActionConfig(
         notification_config=NotificationConfig(
-            sound=NotificationSound.ERROR, icon=Assets.get_icon("error_icon")
+            sound=NotificationSound.ERROR, icon=lambda: Assets.get_icon("error_icon")
         ),
         console_style=ConsoleStyle.FATAL_ERROR,
     )
 
     term_exit_action_config = ExitActionConfig(
         notification_config=NotificationConfig(
-            sound=NotificationSound.ERROR, icon=Assets.get_icon("error_icon")
+            sound=NotificationSound.ERROR, icon=lambda: Assets.get_icon("error_icon")
         ),
         console_style=ConsoleStyle.FATAL_ERROR,
     )
 
     die_exit_action_config = ExitActionConfig(
         notification_config=NotificationConfig(
-            sound=NotificationSound.ERROR, icon=Assets.get_icon("error_icon")
+            sound=NotificationSound.ERROR, icon=lambda: Assets.get_icon("error_icon")
         ),
         console_style=ConsoleStyle.FATAL_ERROR,
     )
 
     success_exit_action_config = ExitActionConfig(
         notification_config=NotificationConfig(
-            sound=NotificationSound.SUCCESS, icon=Assets.get_icon("success_icon")
+            sound=NotificationSound.SUCCESS, icon=lambda: Assets.get_icon("success_icon")
         ),
         console_style=ConsoleStyle.SUCCESS,
     )
@@ -200,6 +293,7 @@ class Script:
         if cls._on_exit_called:
             return
         cls._on_exit_called = True
+        cls._exit_summary = message if not details else f"{message} • {details}"
 
         # Flush console
         Console.flush()
@@ -221,9 +315,36 @@ class Script:
             Console.write(s, style=config.console_style)
             Console.write_empty_line()
 
+        # log only, the stats are for tuning
+        if CodeCache.stats.lookups > 0:
+            Console.write(f"{cls._stack.display_path} {CodeCache.stats}", to_display=False)
+
+        if Trace.is_enabled() and not cls._stack.is_nested:
+            cls._write_trace()
+
+        if Profiling.is_enabled() and not cls._stack.is_nested:
+            cls._finish_profiling()
+
+        if RunHistory.is_enabled() and not cls._stack.is_nested:
+            cls._record_history(message)
+
+        if Metrics.is_enabled() and not cls._stack.is_nested:
+            cls._write_metrics()
+
+        if Trash.pending() and not cls._stack.is_nested:
+            Trash.finish()
+
+        backend = cls.clipboard.backend
+        if isinstance(backend, SQLiteClipboardBackend) and backend.delete_on_close and not cls._stack.is_nested:
+            backend.close()
+
+        # the whole script is done, nothing to resume next time; kept unless the exit status is known to be 0
+        if cls._is_success() and not cls._stack.is_nested and cls._checkpoints is not None:
+            cls._checkpoints.discard()
+
         Console.finalize()
 
-        if do_show_notification and config.notification_config is not None:
+        if do_show_notification and cls._exit_notifications and config.notification_config is not None:
             show_notification(
                 details if details is not None else "",
                 # f"Execution time {elapsed_duration}",
@@ -231,6 +352,7 @@ class Script:
                 # subtitle=details,
                 config=config.notification_config,
             )
+            Notifications.wait()
 
     # @classmethod
     # @property
@@ -244,12 +366,134 @@ class Script:
         """
         return Path(cls._stack.current.path.parent) + subpath
 
+    @classmethod
+    def enable_trace(cls, output_path):
+        """
+        Records Runner executions, subscripts and steps and writes them as a Chrome trace JSON at exit.
+        The same as running the script with MK_TRACE=<output_path>.
+        """
+        Trace.enable(output_path)
+
+    @classmethod
+    @contextlib.contextmanager
+    def step(cls, name: str):
+        """A named block shown as a span in the trace: `with Script.step("Upload"): ...`"""
+        with Trace.span(name, "step", {"stack": cls._stack.display_path}):
+            yield
+
+    @classmethod
+    def checkpoint(cls, name: str, action: Callable[[], Any], inputs=None, outputs: list[str] | None = None):
+        """
+        Runs [action] as a named checkpoint and persists its completion, result and the [outputs] clipboard keys.
+        When the script is started with --resume (or MK_RESUME=1), a checkpoint completed by the previous run
+        with the same [inputs] is skipped: the clipboard outputs are restored and the recorded result is returned.
+        The state is keyed by the script path and arguments and is discarded once the script finishes successfully:
+        by Script.success() or Script.exit(0), or with a zero exit status when run by the warm daemon.
+        Inputs must be JSON-serializable (path-like values are stringified), outputs and result must be picklable.
+        """
+        if cls._checkpoints is None:
+            cls._checkpoints = CheckpointStore(cls._stack.items[0].path, sys.argv[1:], resume=cls.resume)
+        full_name = f"{cls._stack.display_path} {name}"
+        inputs_digest = CheckpointStore.digest_inputs(inputs)
+
+        entry = cls._checkpoints.get_completed(full_name, inputs_digest)
+        if entry is not None:
+            Console.write_section_header(f"▸ {name}: skipped, completed by the previous run")
+            for key, value in entry["outputs"].items():
+                cls.clipboard[key] = value
+            return entry["result"]
+
+        with Trace.span(name, "checkpoint", {"stack": cls._stack.display_path}):
+            result = action()
+        recorded_outputs = {key: cls.clipboard.get(key) for key in Safe.to_list(outputs)}
+        cls._checkpoints.set_completed(full_name, inputs_digest, recorded_outputs, result)
+        return result
+
+    @classmethod
+    def enable_profiling(cls, cpu: bool = True, mem: bool = False):
+        """
+        Starts cProfile and/or tracemalloc for the rest of the run, the same as MK_PROFILE=cpu|mem|cpu,mem.
+        The reports are written at exit next to the Console log file (or to the user cache), with a top-N summary printed.
+        """
+        Profiling.enable(cpu=cpu, mem=mem)
+
+    @classmethod
+    def _finish_profiling(cls):
+        log_file_path = Console.log_file_path()
+        if log_file_path is not None:
+            directory = Path(os.path.dirname(os.path.abspath(log_file_path)))
+        else:
+            directory = Directory.user_cache("profiles").path
+        name = re.sub(r"\W+", "_", cls._stack._get_name()).strip("_").lower()  # pylint: disable=protected-access
+        base_path = directory + f"{name}-{DateTime().format(DateTimeFormat.LOG_FILE_NAME)}-{os.getpid()}"
+        try:
+            for summary in Profiling.finish(base_path.fspath):
+                Console.write_empty_line()
+                Console.write(summary)
+        except Exception as e:
+            Console.write(f"Unable to write the profiling reports: {e}", style=ConsoleStyle.WARNING)
+
+    @classmethod
+    def _record_history(cls, exit_reason: str):
+        try:
+            RunHistory.record_run(
+                cls._stack._get_name(),  # pylint: disable=protected-access
+                sys.argv[1:],
+                exit_reason,
+                cls._stack.items[0].time_counter.elapsed_duration.ns,
+            )
+        except Exception as e:
+            Console.write(f"Unable to record the run history: {e}", to_display=False)
+
+    @classmethod
+    def _write_metrics(cls):
+        script = cls._stack._get_name()  # pylint: disable=protected-access
+        Metrics.counter("mk_script_runs_total", "Script runs by outcome", ["script", "outcome"]).inc(
+            script=script, outcome="failure" if cls._is_failure() else "success"
+        )
+        Metrics.histogram("mk_script_duration_seconds", "Script run time", ["script"]).observe(
+            cls._stack.items[0].time_counter.elapsed_duration.ns / 1e9, script=script
+        )
+        Metrics.gauge("mk_script_last_run_timestamp_seconds", "Script last run end time", ["script"]).set(
+            time.time(), script=script
+        )
+        try:
+            Metrics.write_textfile()
+        except Exception as e:
+            Console.write(f"Unable to write the metrics: {e}", style=ConsoleStyle.WARNING)
+
+    @classmethod
+    def _write_trace(cls):
+        root = cls._stack.items[0]
+        Trace.add_span(
+            cls._stack.display_path,
+            "script",
+            root.time_counter.started_ns // 1000,
+            Trace.now_us(),
+            {"exit": cls._exit_summary},
+        )
+        try:
+            Trace.write(process_name=cls._stack.display_path)
+        except Exception as e:
+            Console.write(f"Unable to write the trace: {e}", style=ConsoleStyle.WARNING)
+
+    @classmethod
+    def _is_failure(cls) -> bool:
+        """Died, interrupted or exited with a non-zero code"""
+        return cls._failed or bool(cls._exit_code)
+
+    @classmethod
+    def _is_success(cls) -> bool:
+        """Exited with a known zero code"""
+        return not cls._failed and cls._exit_code == 0
+
     @classmethod
     def _on_default_exit(cls):
         cls._on_exit2(cls.default_exit_action_config, "finished")
 
     @classmethod
     def _on_sig_term(cls):
+        cls._failed = True
         cls._on_exit2(cls.term_exit_action_config, "terminated")
 
     @classmethod
@@ -260,6 +504,7 @@ class Script:
         else:
             message = "is interrupted by uncaught exception"
             details = f"{exc_type.__name__}({value})"
+        cls._failed = True
         cls._on_exit2(cls.exception_exit_action_config, message, details)
         if cls._original_except_hook is not None:
             cls._original_except_hook(
@@ -268,12 +513,15 @@ class Script:
 
     @classmethod
     def die(cls, message: str) -> NoReturn:
+        cls._failed = True
         cls._on_exit2(cls.term_exit_action_config, "died", message)
         cls.exit(1)
 
     @classmethod
     def success(cls, message: str | None = None):
         full_effects = not cls._stack.is_nested
+        if full_effects:
+            cls._exit_code = 0
         cls._on_exit2(
             cls.success_exit_action_config,
             "completed",
@@ -285,6 +533,7 @@ class Script:
 
     @classmethod
     def exit(cls, code: int) -> NoReturn:
+        cls._exit_code = _exit_status(code)
         sys.exit(code)
 
     @classmethod
@@ -296,6 +545,8 @@ class Script:
         """
         Returns the resulting module globals dictionary.
         """
+        from rich.rule import Rule  # pylint: disable=import-outside-toplevel
+
         try:
             p = Path(path)
             if not p.is_absolute:
@@ -307,7 +558,8 @@ class Script:
             Console.write_empty_line()
             try:
                 cls._stack.push(p.fspath)
-                return run_path(p.fspath, init_globals=init_globals)
+                with Trace.span(cls._stack.display_path, "subscript", {"path": p.fspath}):
+                    return CodeCache.run_path(p.fspath, init_globals=init_globals)
 
             finally:
                 cls._on_exit_called = False
@@ -319,6 +571,117 @@ class Script:
         except Exception as e:
             cls.die(f"Unable to run subscript [{path}]: {e}")
 
+    @classmethod
+    def use_shared_clipboard(cls, path=None) -> ScriptClipboard:
+        """
+        Switches Script.clipboard to an SQLite (WAL) store at [path], shared with other processes,
+        e.g. subscripts run by run_subscripts_parallel(). The current clipboard content is copied to it.
+        Without [path], a temporary per-run file is used, deleted at exit. Pass a persistent path to keep data between runs.
+        """
+        if path is None:
+            backend = SQLiteClipboardBackend(default_shared_clipboard_path(), delete_on_close=True)
+        else:
+            backend = SQLiteClipboardBackend(path)
+        for key, value in cls.clipboard.backend.items():
+            backend.set(key, value)
+        cls.clipboard = ScriptClipboard(backend)
+        return cls.clipboard
+
+    @classmethod
+    def set_result(cls, value):
+        """
+        Sets an explicit result payload of the current (sub)script.
+        run_subscripts_parallel() returns it instead of the subscript globals. The value must be picklable.
+        """
+        cls._stack.current.result = value
+        cls._stack.current.has_result = True
+
+    @classmethod
+    def run_subscripts_parallel(cls, paths, max_workers: int | None = None, init_globals=None) -> list:
+        """
+        Runs independent subscripts in separate processes, up to [max_workers] at once.
+        Each child output is streamed to the console prefixed with the child stack name.
+        Returns the list of results in the order of [paths]: the explicit payload set by Script.set_result()
+        or the picklable part of the subscript globals. A shared clipboard (see use_shared_clipboard()) is shared with the children. Dies once with all the failures if any of the subscripts fail.
+        """
+        from rich.rule import Rule  # pylint: disable=import-outside-toplevel
+
+        resolved = []
+        for path in Safe.to_list(paths):
+            p = Path(path)
+            if not p.is_absolute:
+                p = Path([cls._stack.current.directory, path])
+            if not p.exists_as_file:
+                cls.die(f"Unable to run subscript [{path}]: {p} does not exist")
+            resolved.append(p)
+
+        stack_paths = [i.path.fspath for i in cls._stack.items]
+        backend = cls.clipboard.backend
+        clipboard_path = backend.path.fspath if isinstance(backend, SQLiteClipboardBackend) else None
+        env = dict(os.environ)
+        env["PYTHONUNBUFFERED"] = "1"
+        package_root = Path([os.path.realpath(__file__), "..", "..", ".."]).fspath  # the directory containing `mk`
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+        output_lock = threading.Lock()
+
+        def run_one(work_dir: str, index: int, p: Path):
+            prefix = f"[{cls._stack._get_name()} >> {_StackItem(p).name}]"  # pylint: disable=protected-access
+            input_path = os.path.join(work_dir, f"{index}.in")
+            output_path = os.path.join(work_dir, f"{index}.out")
+            trace_path = os.path.join(work_dir, f"{index}.trace.json")
+            with open(input_path, "wb") as f:
+                pickle.dump({"stack": stack_paths, "init_globals": init_globals, "clipboard": clipboard_path}, f)
+
+            child_env = env
+            if Trace.is_enabled():
+                child_env = dict(env, MK_TRACE=trace_path)
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "mk.core._subscript_worker", p.fspath, input_path, output_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                env=child_env,
+            )
+            if proc.stdout is not None:
+                with proc.stdout:
+                    for line_b in iter(proc.stdout.readline, b""):
+                        line = line_b.decode("utf-8", errors="replace").rstrip()
+                        with output_lock:
+                            Console.write(f"{prefix} {line}")
+            code = proc.wait()
+            Trace.merge_file(trace_path)
+
+            try:
+                with open(output_path, "rb") as f:
+                    payload = pickle.load(f)
+            except Exception:
+                payload = {"code": code, "error": None, "result": None}
+            if code and not payload["error"]:
+                payload["error"] = f"exited with code {code}"
+            return prefix, payload
+
+        Console.write_empty_line()
+        Console.write_raw(Rule(title=f"Running {len(resolved)} subscripts in parallel..."))
+        Console.write_empty_line()
+
+        # pylint: disable=import-outside-toplevel
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+
+        with tempfile.TemporaryDirectory(prefix="mk-subscripts-") as work_dir:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(run_one, work_dir, i, p) for i, p in enumerate(resolved)]
+                outcomes = [f.result() for f in futures]
+
+        Console.write_empty_line()
+        Console.write_raw(Rule(title=f"Finished {len(resolved)} parallel subscripts"))
+        Console.write_empty_line()
+
+        failures = [f"{prefix} {payload['error']}" for prefix, payload in outcomes if payload["code"]]
+        if failures:
+            cls.die(f"{len(failures)} of {len(outcomes)} parallel subscripts failed: " + "; ".join(failures))
+        return [payload["result"] for _, payload in outcomes]
+
     @classmethod
     def import_module(cls, name, path):
         try:
@@ -342,7 +705,11 @@ class Script:
             sys.modules[spec.name] = module
             if spec.loader is None:
                 raise Exception(f"Unable to create a loader for [{path}]")
-            spec.loader.exec_module(module)
+            if spec.origin is not None and spec.origin.endswith(".py"):
+                exec(CodeCache.get_code(p), module.__dict__)  # pylint: disable=exec-used
+            else:
+                # .pyc, extension modules...: the code cache handles the source files only
+                spec.loader.exec_module(module)
             return module
 
         except Exception as e:
@@ -4,7 +4,6 @@
 import datetime
 import time
 from enum import Enum
-from dateutil.tz import tzlocal
 from .to_string_builder import ReprBuilderMixin, ToStringBuilder
 
 
@@ -14,6 +13,8 @@ class DateTimeFormat(Enum):
 
 class DateTime(ReprBuilderMixin):
     def __init__(self):
+        from dateutil.tz import tzlocal  # pylint: disable=import-outside-toplevel
+
         self.t = datetime.datetime.now(tzlocal())
 
     # ReprBuilderMixin overrides
@@ -35,6 +36,10 @@ class Duration:
     def __init__(self, ns: int):
         self._ns = ns
 
+    @property
+    def ns(self) -> int:
+        return self._ns
+
     def format(self, fmt: DurationFormat) -> str:
         if fmt == DurationFormat.S:
             return self._format_seconds()
@@ -69,6 +74,14 @@ class TimeCounter(ReprBuilderMixin):
     # def elapsed_ns(self) -> int:
     #     return time.perf_counter_ns() - self._start
 
+    def restart(self):
+        self._start = time.perf_counter_ns()
+
+    @property
+    def started_ns(self) -> int:
+        """time.perf_counter_ns() value at the moment the counter was created"""
+        return self._start
+
     @property
     def elapsed_duration(self) -> Duration:
         return Duration(ns=time.perf_counter_ns() - self._start)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# cSpell: words perfetto getpid
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+class Trace:
+    """
+    Span recorder producing a Chrome trace JSON (chrome://tracing, https://ui.perfetto.dev).
+    Disabled unless enabled explicitly or via MK_TRACE=<output file>. Recording a span when disabled is a no-op.
+    """
+
+    _events: list | None = None
+    _output_path: str | None = None
+
+    @classmethod
+    def enable(cls, output_path):
+        cls._output_path = os.fspath(output_path)
+        if cls._events is None:
+            cls._events = []
+
+    @classmethod
+    def enable_from_environment(cls):
+        output_path = os.environ.get("MK_TRACE")
+        if output_path:
+            cls.enable(output_path)
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls._events is not None
+
+    @staticmethod
+    def now_us() -> int:
+        # perf_counter is system-wide monotonic on macOS and Linux, so child process spans line up
+        return time.perf_counter_ns() // 1000
+
+    @classmethod
+    def add_span(cls, name: str, category: str, start_us: int, end_us: int, args: dict | None = None):
+        if cls._events is None:
+            return
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start_us,
+            "dur": max(end_us - start_us, 0),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        cls._events.append(event)
+
+    @classmethod
+    @contextlib.contextmanager
+    def span(cls, name: str, category: str, args: dict | None = None):
+        if cls._events is None:
+            yield
+            return
+        start_us = cls.now_us()
+        try:
+            yield
+        finally:
+            cls.add_span(name, category, start_us, cls.now_us(), args)
+
+    @classmethod
+    def merge_file(cls, path):
+        """Adds events recorded by another process, e.g. a parallel subscript worker"""
+        if cls._events is None:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cls._events.extend(json.load(f).get("traceEvents", []))
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def write(cls, process_name: str | None = None):
+        if cls._events is None or cls._output_path is None:
+            return
+        events = list(cls._events)
+        if process_name is not None:
+            events.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": process_name}})
+        with open(cls._output_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
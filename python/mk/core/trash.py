@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# cSpell: words rmtree getpid getuid
+
+# Background removal for FSEntry.remove(background=True): the entry is renamed into a trash directory on the
+# same volume, which is atomic and instant, and then deleted by daemon threads working on the subdirectories
+# in parallel. Script exit waits a little for them and hands what is left to a detached, stdlib only process.
+# There is no trash next to the entry: it could be inside a directory that retention, snapshots or syncs walk,
+# so without a per-volume trash the entry is removed synchronously.
+
+import os
+import sys
+import stat
+import time
+import itertools
+import threading
+import subprocess
+from .console import Console, ConsoleStyle
+
+# the detached cleaner, run with `python -I -c`: importing mk would initialize a Script and record its run
+_CLEANER = """
+import os, sys, shutil
+for path in sys.argv[1:]:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+"""
+
+
+class _Removal:
+    """A directory being removed, rmdir()-ed once its own scan and the removals of its subdirectories are done"""
+
+    __slots__ = ("path", "parent", "pending")
+
+    def __init__(self, path: str, parent: "_Removal | None"):
+        self.path = path
+        self.parent = parent
+        self.pending = 1  # the scan itself
+
+
+class Trash:
+    # seconds the Script exit waits for the background removals before detaching them, None waits for all
+    drain_timeout: float | None = 1.0
+    workers = min(8, os.cpu_count() or 1)
+
+    _lock = threading.Lock()
+    _idle = threading.Condition(_lock)
+    _queue = None  # queue.SimpleQueue, created with the threads
+    _threads: list = []
+    _directories: dict[int, str | None] = {}  # device -> trash directory, None if there is no usable one
+    _outstanding: set[str] = set()  # the top level trash entries not fully removed yet
+    _names = itertools.count()
+
+    @classmethod
+    def discard(cls, path: str) -> bool:
+        """
+        Renames [path] into the trash of its volume and schedules its removal.
+        False if it cannot be renamed (no writable trash on the volume, busy mount point...), remove it synchronously then.
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        try:
+            directory = cls._get_directory(os.stat(parent).st_dev, parent)
+        except OSError:
+            return False
+        if directory is None:
+            return False
+        target = os.path.join(directory, f"{time.time_ns()}-{os.getpid()}-{next(cls._names)}-{os.path.basename(path)}")
+        try:
+            os.rename(path, target)
+        except OSError:
+            return False
+        cls._schedule(target)
+        return True
+
+    @classmethod
+    def pending(cls) -> int:
+        with cls._lock:
+            return len(cls._outstanding)
+
+    @classmethod
+    def drain(cls, timeout: float | None = None) -> bool:
+        """Waits for the background removals, True if they are all done"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with cls._idle:
+            while cls._outstanding:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                cls._idle.wait(remaining)
+        return True
+
+    @classmethod
+    def finish(cls):
+        """Script exit: drains for drain_timeout seconds, then the rest goes to a detached process"""
+        if cls.drain(cls.drain_timeout):
+            return
+        with cls._lock:
+            paths = sorted(cls._outstanding)
+        if not paths:
+            return
+        try:
+            # the daemon threads die with this process, the detached one copes with what they already removed
+            subprocess.Popen(
+                [sys.executable, "-I", "-c", _CLEANER, *paths],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        except OSError as e:
+            Console.write(f"Unable to detach the removal of {len(paths)} trash entries: {e}", style=ConsoleStyle.WARNING)
+
+    # trash directories
+    @classmethod
+    def _get_directory(cls, device: int, parent: str) -> str | None:
+        with cls._lock:
+            if device in cls._directories:
+                return cls._directories[device]
+        directory = cls._find_directory(device, parent)
+        with cls._lock:
+            if device in cls._directories:
+                return cls._directories[device]
+            cls._directories[device] = directory
+        if directory is not None:
+            # leftovers of the runs killed before their removals were done
+            for name in os.listdir(directory):
+                cls._schedule(os.path.join(directory, name))
+        return directory
+
+    @classmethod
+    def _find_directory(cls, device: int, parent: str) -> str | None:
+        from .fs import Directory  # pylint: disable=import-outside-toplevel # fs imports us
+
+        candidates = []
+        cache = Directory.user_cache().path.fspath
+        if os.stat(cache).st_dev == device:
+            candidates.append(os.path.join(cache, "trash"))
+        mount_point = parent
+        while mount_point != os.path.dirname(mount_point) and os.stat(os.path.dirname(mount_point)).st_dev == device:
+            mount_point = os.path.dirname(mount_point)
+        uid = os.getuid() if hasattr(os, "getuid") else 0
+        candidates.append(os.path.join(mount_point, f".mk-trash-{uid}"))
+        for candidate in candidates:
+            try:
+                os.makedirs(candidate, mode=0o700, exist_ok=True)
+                st = os.lstat(candidate)
+            except OSError:
+                continue
+            # not a link planted by someone else, and really on the volume
+            if stat.S_ISDIR(st.st_mode) and st.st_dev == device and os.access(candidate, os.W_OK):
+                return candidate
+        return None
+
+    # removal
+    @classmethod
+    def _schedule(cls, path: str):
+        with cls._lock:
+            cls._outstanding.add(path)
+            if cls._queue is None:
+                import queue  # pylint: disable=import-outside-toplevel
+
+                cls._queue = queue.SimpleQueue()
+            while len(cls._threads) < cls.workers:
+                thread = threading.Thread(target=cls._work, name="mk-trash", daemon=True)
+                cls._threads.append(thread)
+                thread.start()
+        cls._queue.put(_Removal(path, None))
+
+    @classmethod
+    def _work(cls):
+        while True:
+            removal = cls._queue.get()
+            try:
+                cls._remove(removal)
+            except Exception as e:
+                Console.write(f"{removal.path}: unable to remove: {e}", to_display=False)
+                cls._abandon(removal)
+
+    @classmethod
+    def _remove(cls, removal: _Removal):
+        try:
+            st = os.lstat(removal.path)
+        except FileNotFoundError:
+            cls._release(removal, rmdir=False)
+            return
+        if not stat.S_ISDIR(st.st_mode):
+            _unlink(removal.path)
+            cls._release(removal, rmdir=False)
+            return
+        subdirectories = []
+        try:
+            with os.scandir(removal.path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(_Removal(entry.path, removal))
+                    else:
+                        _unlink(entry.path)
+        except FileNotFoundError:
+            pass  # the leftovers of another run, removed by it meanwhile
+        with cls._lock:
+            removal.pending += len(subdirectories)
+        for subdirectory in subdirectories:
+            cls._queue.put(subdirectory)
+        cls._release(removal, rmdir=True)
+
+    @classmethod
+    def _release(cls, removal: _Removal | None, rmdir: bool):
+        while removal is not None:
+            with cls._lock:
+                removal.pending -= 1
+                if removal.pending:
+                    return
+            if rmdir:
+                try:
+                    os.rmdir(removal.path)
+                except FileNotFoundError:
+                    pass
+            if removal.parent is None:
+                with cls._idle:
+                    cls._outstanding.discard(removal.path)
+                    cls._idle.notify_all()
+            removal, rmdir = removal.parent, True
+
+    @classmethod
+    def _abandon(cls, removal: _Removal):
+        """The entry stays in the trash, removed by a later run"""
+        while removal.parent is not None:
+            removal = removal.parent
+        with cls._idle:
+            cls._outstanding.discard(removal.path)
+            cls._idle.notify_all()
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except PermissionError:
+        # a read-only directory, as shutil.rmtree() does not cope with either
+        os.chmod(os.path.dirname(path), stat.S_IRWXU)
+        os.unlink(path)
+
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+# cSpell: words inotify cloexec nonblock errno
+
+# Directory watching for Directory.watch(): Linux inotify through ctypes, stat polling (Directory.snapshot() diffs)
+# everywhere else. Events are coalesced into ChangeSet batches once the tree is quiet for the debounce time.
+
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import fnmatch
+import select
+import struct
+import threading
+from typing import Callable
+from .console import Console, ConsoleStyle
+from .to_string_builder import ReprBuilderMixin, ToStringBuilder
+
+# <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+
+_ADDED = "added"
+_MODIFIED = "modified"
+_REMOVED = "removed"
+
+
+class ChangeSet(ReprBuilderMixin):
+    """A batch of changes, absolute paths. A directory moved or removed as a whole is reported as itself"""
+
+    def __init__(self):
+        self.added: set = set()
+        self.modified: set = set()
+        self.removed: set = set()
+
+    def __bool__(self):
+        return bool(self.added or self.modified or self.removed)
+
+    @property
+    def paths(self) -> set:
+        return self.added | self.modified | self.removed
+
+    # ReprBuilderMixin overrides
+    def configure_repr_builder(self, sb: ToStringBuilder):
+        sb.add("added", len(self.added))
+        sb.add("modified", len(self.modified))
+        sb.add("removed", len(self.removed))
+
+
+class _Batch:
+    """Coalesces the events: created then modified is added, created then removed is nothing, etc."""
+
+    def __init__(self):
+        self.changes: dict[str, str] = {}
+
+    def add(self, path: str, change: str):
+        previous = self.changes.get(path)
+        if previous == _ADDED and change == _REMOVED:
+            del self.changes[path]
+        elif previous == _ADDED:
+            pass
+        elif previous == _REMOVED and change == _ADDED:
+            self.changes[path] = _MODIFIED
+        else:
+            self.changes[path] = change
+
+    def take(self) -> ChangeSet:
+        from .fs import Path  # pylint: disable=import-outside-toplevel # fs imports us lazily as well
+
+        result = ChangeSet()
+        for path, change in self.changes.items():
+            getattr(result, change).add(Path(path))
+        self.changes = {}
+        return result
+
+
+class Watcher:
+    """Started by Directory.watch(); calls back on its own thread. Stop with stop(), or use as a context manager"""
+
+    def __init__(
+        self,
+        root: str,
+        callback: Callable[[ChangeSet], None],
+        recursive: bool,
+        debounce_ms: int,
+        filters,
+        prune,
+        backend: str,
+        poll_interval: float,
+    ):
+        self.root = root
+        self._callback = callback
+        self._recursive = recursive
+        self._debounce = debounce_ms / 1000
+        self._filters = [filters] if isinstance(filters, str) else list(filters or [])
+        self._prune = frozenset(prune or [])
+        self._poll_interval = poll_interval
+        self._stop = threading.Event()
+        if backend == "auto":
+            backend = "inotify" if _Inotify.is_available() else "poll"
+        self.backend = backend
+        self._thread = threading.Thread(target=self._run, name="mk-watch", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stop(self):
+        self._stop.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def wait(self):
+        """Blocks until stopped, e.g. by Ctrl+C"""
+        try:
+            while self._thread.is_alive():
+                self._thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _is_selected(self, path: str) -> bool:
+        name = os.path.basename(path)
+        return not self._filters or any(fnmatch.fnmatch(name, f) for f in self._filters)
+
+    def _is_pruned(self, path: str) -> bool:
+        relative = os.path.relpath(path, self.root)
+        return any(part in self._prune for part in relative.split(os.sep))
+
+    def _deliver(self, batch: _Batch):
+        changes = batch.take()
+        if not changes:
+            return
+        try:
+            self._callback(changes)
+        except Exception as e:
+            Console.write(f"{self.root}: the watch callback failed: {e!r}", style=ConsoleStyle.WARNING)
+
+    def _run(self):
+        if self.backend == "inotify":
+            try:
+                self._run_inotify()
+                return
+            except _InotifySetupError as e:
+                # e.g. ENOSPC: fs.inotify.max_user_watches is too low for the tree
+                Console.write(f"{self.root}: {e.__cause__}, falling back to polling", style=ConsoleStyle.WARNING)
+                self.backend = "poll"
+        self._run_poll()
+
+    # polling backend
+    def _snapshot(self):
+        from .fs import Directory  # pylint: disable=import-outside-toplevel
+
+        return Directory(self.root).snapshot(prune=self._prune or None)
+
+    def _run_poll(self):
+        batch = _Batch()
+        previous = self._snapshot()
+        last_change = None
+        while not self._stop.wait(self._poll_interval if last_change is None else min(self._poll_interval, self._debounce)):
+            current = self._snapshot()
+            diff = previous.diff(current)
+            for change, paths, snapshot in [
+                (_ADDED, diff.added, current),
+                (_REMOVED, diff.removed, previous),
+                (_MODIFIED, diff.modified, current),
+            ]:
+                for relative in paths:
+                    if snapshot.entries[relative].kind == "d":
+                        continue  # the contents are reported
+                    if not self._recursive and os.sep in relative:
+                        continue
+                    path = os.path.join(self.root, relative)
+                    if self._is_selected(path):
+                        batch.add(path, change)
+            previous = current
+            if diff:
+                last_change = time.monotonic()
+            elif last_change is not None and time.monotonic() - last_change >= self._debounce:
+                self._deliver(batch)
+                last_change = None
+
+    # inotify backend
+    def _run_inotify(self):
+        from .fs import Directory  # pylint: disable=import-outside-toplevel
+
+        inotify = _Inotify()
+        batch = _Batch()
+        try:
+
+            def add_tree(path: str, report_files: bool):
+                inotify.add_watch(path)
+                if not self._recursive:
+                    return
+                for e in Directory(path).iter(prune=self._prune or None, skip_system_objects=False):
+                    if e.is_directory and not e.is_link:
+                        inotify.add_watch(e.path.fspath)
+                    elif report_files and self._is_selected(e.path.fspath):
+                        # created before the watch was in place
+                        batch.add(e.path.fspath, _ADDED)
+
+            try:
+                add_tree(self.root, report_files=False)
+            except OSError as e:
+                raise _InotifySetupError() from e
+            last_change = None
+            while not self._stop.is_set():
+                timeout = 0.25 if last_change is None else max(0.0, self._debounce - (time.monotonic() - last_change))
+                events = inotify.read(min(timeout, 0.25))
+                for path, mask in events:
+                    if mask & _IN_Q_OVERFLOW:
+                        Console.write(f"{self.root}: inotify queue overflow, some changes may be missed", style=ConsoleStyle.WARNING)
+                        continue
+                    if path is None or self._is_pruned(path):
+                        continue
+                    if mask & _IN_ISDIR:
+                        if mask & (_IN_CREATE | _IN_MOVED_TO) and self._recursive:
+                            try:
+                                add_tree(path, report_files=True)
+                            except OSError:
+                                pass  # already gone
+                        elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                            batch.add(path, _REMOVED)
+                        continue
+                    if not self._is_selected(path):
+                        continue
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        batch.add(path, _ADDED)
+                    elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                        batch.add(path, _REMOVED)
+                    elif mask & (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_ATTRIB):
+                        batch.add(path, _MODIFIED)
+                if events:
+                    last_change = time.monotonic()
+                elif last_change is not None and time.monotonic() - last_change >= self._debounce:
+                    self._deliver(batch)
+                    last_change = None
+        finally:
+            inotify.close()
+
+
+class _InotifySetupError(Exception):
+    pass
+
+
+class _Inotify:
+    _libc = None
+
+    @classmethod
+    def _get_libc(cls):
+        if cls._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            cls._libc = libc
+        return cls._libc
+
+    @classmethod
+    def is_available(cls) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            return hasattr(cls._get_libc(), "inotify_init1")
+        except OSError:
+            return False
+
+    def __init__(self):
+        self._fd = self._get_libc().inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths: dict[int, str] = {}  # watch descriptor -> directory
+
+    def add_watch(self, path: str):
+        wd = self._get_libc().inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed: {os.strerror(errno)}", path)
+        self._paths[wd] = path
+
+    def read(self, timeout: float) -> list:
+        """(path, mask) pairs; path is None for the queue events"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & _IN_IGNORED:
+                self._paths.pop(wd, None)  # the directory is gone
+                continue
+            directory = self._paths.get(wd)
+            if directory is None:
+                events.append((None, mask))
+            elif name:
+                events.append((os.path.join(directory, os.fsdecode(name)), mask))
+            elif mask & _IN_DELETE_SELF:
+                continue  # the parent directory reports it
+        return events
+
+    def close(self):
+        os.close(self._fd)
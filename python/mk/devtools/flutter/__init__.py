@@ -4,14 +4,31 @@
 
 from typing import Dict, Optional
 from enum import Enum
-from .assets import *
 from .project import Project
-from ...core import Runner
+from ...core import (
+    ReprBuilderMixin,
+    ToStringBuilder,
+    Console,
+    Runner,
+    File,
+    Directory,
+    RetentionPolicy,
+    die,
+)
 from ..xcode import Xcode
 
 __all__ = ["Assets", "Project"]
 
 
+def __getattr__(name):
+    # PEP 562: flutter.Assets pulls in PIL, so it is loaded only when actually requested
+    if name == "Assets":
+        from .assets import Assets  # pylint: disable=import-outside-toplevel
+
+        return Assets
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 class BuildMode(Enum):
     DEBUG = {"name": "Debug", "flag": "--debug", "file_name": "debug"}
     RELEASE = {"name": "Release", "flag": "--release", "file_name": "release"}
@@ -230,6 +247,7 @@ class Flutter(ReprBuilderMixin):
         app_store_export: bool = False,
         app_store_upload: bool = False,
         reveal_result: bool = True,
+        retention: RetentionPolicy | None = None,  # applied to archive_dir
     ) -> FlutterResult:
         # check state and args
         assert isinstance(project, Project)
@@ -268,21 +286,21 @@ class Flutter(ReprBuilderMixin):
             archive_file = File(
                 [archive_dir, r.namer.get(postfix=".xcarchive", include_version=True)]
             )
-            archive_file.remove()
+            archive_file.remove(background=True)
             if ad_hoc_export:
                 do_export_ad_hoc = True
                 ad_hoc_directory = Directory([archive_dir, "ad_hoc"])
-                ad_hoc_directory.remove()
+                ad_hoc_directory.remove(background=True)
             if app_store_export:
                 do_export_app_store = True
                 app_store_directory = Directory([archive_dir, "app_store"])
-                app_store_directory.remove()
+                app_store_directory.remove(background=True)
             if app_store_upload:
                 do_upload_app_store = True
                 app_store_upload_directory = Directory(
                     [archive_dir, "app_store_upload"]
                 )
-                app_store_upload_directory.remove()
+                app_store_upload_directory.remove(background=True)
 
         # Run flutter. On completion stop unless archiving is ordered
         r.run()
@@ -330,6 +348,12 @@ class Flutter(ReprBuilderMixin):
                 display_output=False,
             )
 
+        if retention is not None:
+            Directory(archive_dir).apply_retention(
+                retention,
+                protect=[archive_file, ad_hoc_directory, app_store_directory, app_store_upload_directory],
+            )
+
         if reveal_result:
             File(archive_file).reveal()
 
@@ -351,6 +375,7 @@ class Flutter(ReprBuilderMixin):
         # app_store_export: bool = False,
         # app_store_upload: bool = False,
         reveal_result: bool = True,
+        retention: RetentionPolicy | None = None,  # applied to archive_dir
     ) -> FlutterResult:
 
         # check state and args
@@ -394,7 +419,7 @@ class Flutter(ReprBuilderMixin):
             archive_file = File(
                 [archive_dir, r.namer.get(postfix=".xcarchive", include_version=True)]
             )
-            archive_file.remove()
+            archive_file.remove(background=True)
             path_to_reveal = archive_file
             result.archive_file = archive_file
             result.archive_dir = archive_dir
@@ -406,14 +431,14 @@ class Flutter(ReprBuilderMixin):
         app_directory = None
         if app_export:
             app_directory = Directory([archive_dir, "app"])
-            app_directory.remove()
+            app_directory.remove(background=True)
             path_to_reveal = app_directory
             result.mac_app_output_dir = app_directory
 
         dev_app_directory = None
         if development_app_export:
             dev_app_directory = Directory([archive_dir, "app_development"])
-            dev_app_directory.remove()
+            dev_app_directory.remove(background=True)
             path_to_reveal = dev_app_directory
             result.mac_app_development_output_dir = dev_app_directory
 
@@ -471,6 +496,11 @@ class Flutter(ReprBuilderMixin):
         #         is_upload=True
         #     )
 
+        if retention is not None:
+            Directory(archive_dir).apply_retention(
+                retention, protect=[archive_file, app_directory, dev_app_directory]
+            )
+
         if reveal_result:
             File(path_to_reveal).reveal()
 
@@ -487,6 +517,7 @@ class Flutter(ReprBuilderMixin):
         reveal_result: bool = True,
         clean_before: bool = True,
         # analyze_size: bool = False
+        retention: RetentionPolicy | None = None,  # applied to output_dir
     ) -> FlutterResult:
 
         # check state and args
@@ -529,8 +560,10 @@ class Flutter(ReprBuilderMixin):
         build_f.ensure_exists()
         build_f.copy_to(output_f)
 
-        # check the result and reveal
+        # check the result, drop the outdated builds and reveal
         output_f.ensure_exists()
+        if retention is not None:
+            output_d.apply_retention(retention, protect=[output_f])
         if reveal_result:
             output_f.reveal()
 
@@ -548,6 +581,7 @@ class Flutter(ReprBuilderMixin):
         reveal_result: bool = True,
         clean_before: bool = True,
         # analyze_size: bool = False
+        retention: RetentionPolicy | None = None,  # applied to output_dir
     ):
 
         # check state and args
@@ -597,8 +631,10 @@ class Flutter(ReprBuilderMixin):
         build_f.ensure_exists()
         build_f.copy_to(output_f)
 
-        # check the result and reveal
+        # check the result, drop the outdated builds and reveal
         output_f.ensure_exists()
+        if retention is not None:
+            output_d.apply_retention(retention, protect=[output_f])
         if reveal_result:
             output_f.reveal()
 
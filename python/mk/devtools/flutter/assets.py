@@ -278,3 +278,26 @@ class Assets(ReprBuilderMixin):
 
         Console.write("Done (few issues found)", style=ConsoleStyle.WARNING)
         return False
+
+    def watch_images(self, images_dir, distribute: bool = True, on_change=None, debounce_ms: int = 500):
+        """
+        Re-runs distribute_images() (if [distribute]) and check_images() whenever images are added, changed
+        or removed; a dropped batch of files is handled once. [on_change] (e.g. a codegen step) is called
+        with the ChangeSet afterwards. Blocks until Ctrl+C.
+        """
+        root_dir = Directory(images_dir, must_exist=True, create_if_needed=False)
+
+        def handle(changes):
+            Console.write(f"{self}: {changes}")
+            if distribute:
+                self.distribute_images(root_dir.path)
+            self.check_images(root_dir.path)
+            if on_change is not None:
+                on_change(changes)
+
+        # bring the directory up to date first
+        if distribute:
+            self.distribute_images(root_dir.path)
+        self.check_images(root_dir.path)
+        Console.write(f"{self}: watching {root_dir.path}, press Ctrl+C to stop")
+        root_dir.watch(handle, debounce_ms=debounce_ms, filters=["*.png", "*.jpg", "*.jpeg", "*.webp", "*.gif"]).wait()
@@ -171,13 +171,11 @@ class Xcode(ReprBuilderMixin):
         add_key_value("destination", destination)
 
         options_file = File(output_path)
-        options_file.open_for_writing()
-        options_file.write(
+        options_file.write_text(
             '<?xml version="1.0" encoding="UTF-8"?>\n'
             '<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n'
             '<plist version="1.0">\n<dict>\n\t' + "\n\t".join(content) + "\n</dict>\n</plist>"
         )
-        options_file.close()
 
     def _export_local(
         self,
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# cSpell: words
+
+# File system micro-benchmarks.
+#   python -m mk.tools.bench_fs path [--count 1000000]
+#   python -m mk.tools.bench_fs list DIRECTORY
+#   python -m mk.tools.bench_fs walk DIRECTORY [--workers 1,2,4,8,16]
+# The walk benchmark is meaningful on cold caches (e.g. after `sudo purge` on macOS) or on network volumes.
+# The "baseline" path columns run _BaselinePath, the code of Path before the normalization cache (comments stripped).
+
+import os
+import sys
+import time
+import argparse
+import functools
+import collections.abc
+from ..core.fs import Path, Directory, File
+
+
+class _BaselinePath:
+    """Path as it was before __slots__ and the normalization cache, the members used by bench_path() only"""
+
+    def __init__(self, path):
+        p = os.path.normpath(os.path.expanduser(self._path_from_object(path)))
+        if not p:
+            raise Exception("Path cannot be empty")
+        self._path = str(p)
+
+    @staticmethod
+    def _path_from_object(p):
+
+        if p is None:
+            return ""
+
+        if isinstance(p, str):
+            return p
+
+        if isinstance(p, os.PathLike):
+            return os.fspath(p)
+
+        if isinstance(p, collections.abc.Sequence) and p:
+            lst = list(map(_BaselinePath._path_from_object, p))
+            return functools.reduce(_BaselinePath._join, lst)
+
+        raise Exception(f"Cannot convert {p} to a path string")
+
+    @staticmethod
+    def _join(path1, path2):
+
+        if path2 == "" or path2 is None:
+            return os.path.join(path1)
+
+        if os.path.isabs(path2):
+            path2 = os.path.splitdrive(path2)[1]
+            if path2.startswith(os.sep):
+                path2 = path2[len(os.sep) :]
+        return os.path.join(path1, path2)
+
+    def __add__(self, other):
+        return _BaselinePath([self._path, other])
+
+    def __fspath__(self) -> str:
+        return self._path
+
+    @property
+    def parent(self) -> "_BaselinePath | None":
+        p = os.path.dirname(self._path)
+        if p == self._path:
+            return None
+        return _BaselinePath(p)
+
+    @property
+    def base_name(self) -> str:
+        return str(os.path.basename(self._path))
+
+    def relative(self, level: int = 0) -> "_BaselinePath":
+        components = [self.base_name]
+        if level > 0:
+            parent = self.parent
+            while level > 0 and parent is not None:
+                components.insert(0, parent.base_name)
+                level -= 1
+                parent = parent.parent
+        return _BaselinePath(components)
+
+
+def _measure(f) -> float:
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def _report(name: str, count: int, baseline: float, current: float):
+    print(f"  {name:<28} {count / baseline / 1e6:>8.2f} M/s {count / current / 1e6:>8.2f} M/s {baseline / current:>7.1f}x")
+
+
+def bench_path(count: int):
+    # a directory listing like workload: a few thousand directories with a few hundred entries each
+    base = Path("/Users/mk/Projects/app/build/ios/Release-iphoneos")
+    baseline_base = _BaselinePath(base.fspath)
+    names = [f"file_{i % 300}.o" for i in range(count)]
+    strings = [f"{base.fspath}/dir_{i // 300}/{n}" for i, n in enumerate(names)]
+
+    print(f"Path, {count} items: {'baseline':>12} {'current':>12} {'speedup':>8}")
+    _report("Path(str)", count, _measure(lambda: [_BaselinePath(s) for s in strings]), _measure(lambda: [Path(s) for s in strings]))
+    _report("path + name", count, _measure(lambda: [baseline_base + n for n in names]), _measure(lambda: [base + n for n in names]))
+
+    baseline_paths = [_BaselinePath(s) for s in strings]
+    paths = [Path(s) for s in strings]
+    _report(
+        "parent.base_name x3",
+        count,
+        _measure(lambda: [p.parent.base_name for p in baseline_paths for _ in range(3)]),
+        _measure(lambda: [p.parent.base_name for p in paths for _ in range(3)]),
+    )
+    _report(
+        "relative(2)",
+        count,
+        _measure(lambda: [p.relative(2) for p in baseline_paths]),
+        _measure(lambda: [p.relative(2) for p in paths]),
+    )
+    elapsed = _measure(lambda: len(set(paths)))
+    print(f"  {'set(paths)':<28} {count / elapsed / 1e6:>21.2f} M/s")
+    elapsed = _measure(lambda: sorted(paths))
+    print(f"  {'sorted(paths)':<28} {count / elapsed / 1e6:>21.2f} M/s")
+
+
+def bench_list(directory: str):
+    def legacy_list():
+        # what Directory.list(recursive=True) did before Directory.iter()
+        result = []
+        for dir_name, dirnames, filenames in os.walk(directory):
+            result += [Directory([dir_name, d]) for d in dirnames]
+            result += [File([dir_name, f]) for f in filenames]
+        return result
+
+    # warm the OS caches first, the comparison is about the CPU cost
+    count = len(legacy_list())
+    print(f"Listing {directory}, {count} entries:")
+    for name, f in [
+        ("os.walk + File/Directory", legacy_list),
+        ("Directory.list()", lambda: Directory(directory).list(skip_system_objects=False)),
+        ("Directory.iter()", lambda: list(Directory(directory).iter(skip_system_objects=False))),
+        ("Directory.iter() + path", lambda: [e.path for e in Directory(directory).iter(skip_system_objects=False)]),
+    ]:
+        elapsed = _measure(f)
+        print(f"  {name:<28} {elapsed:>8.3f}s {count / elapsed / 1e6:>8.2f} M/s")
+
+
+def bench_walk(directory: str, workers: list[int]):
+    count = sum(1 for _ in Directory(directory).iter(skip_system_objects=False))
+    print(f"Walking {directory}, {count} entries:")
+    elapsed = _measure(lambda: sum(1 for _ in Directory(directory).iter(skip_system_objects=False)))
+    print(f"  {'iter()':<28} {elapsed:>8.3f}s {count / elapsed / 1e6:>8.2f} M/s")
+    for n in workers:
+        for ordered in [False, True]:
+            name = f"iter_parallel({n}{', ordered' if ordered else ''})"
+            elapsed = _measure(
+                lambda: sum(1 for _ in Directory(directory).iter_parallel(skip_system_objects=False, ordered=ordered, workers=n))  # pylint: disable=cell-var-from-loop
+            )
+            print(f"  {name:<28} {elapsed:>8.3f}s {count / elapsed / 1e6:>8.2f} M/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mk.tools.bench_fs", description="mk file system micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    path_parser = subparsers.add_parser("path", help="Path construction, joining and derived components")
+    path_parser.add_argument("--count", type=int, default=1_000_000)
+    list_parser = subparsers.add_parser("list", help="recursive directory listing")
+    list_parser.add_argument("directory")
+    walk_parser = subparsers.add_parser("walk", help="sequential and parallel directory walks")
+    walk_parser.add_argument("directory")
+    walk_parser.add_argument("--workers", default="1,2,4,8,16", help="comma separated worker counts")
+    args = parser.parse_args(argv)
+
+    if args.benchmark == "path":
+        bench_path(args.count)
+    elif args.benchmark == "list":
+        bench_list(args.directory)
+    elif args.benchmark == "walk":
+        bench_walk(args.directory, [int(n) for n in args.workers.split(",")])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# cSpell: words
+
+# Run history report: per-step p50/p95 durations over the latest runs with regressions flagged.
+#   python -m mk.tools.history [SCRIPT] [--last N] [--threshold 1.2]
+# Exits with 1 if any regression is found.
+
+import os
+import sys
+import argparse
+from ..core.history import RunHistory
+
+
+def _format_ns(ns) -> str:
+    return "-" if ns is None else f"{ns / 1e9:.1f}s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mk.tools.history", description="mk script run history")
+    parser.add_argument("script", nargs="?", help="script name as shown in the console, e.g. BUILD_IOS")
+    parser.add_argument("--last", type=int, default=20, help="number of the latest runs to analyze")
+    parser.add_argument("--threshold", type=float, default=1.2, help="regression factor against the previous median")
+    parser.add_argument("--db", help="database path")
+    args = parser.parse_args(argv)
+    os.environ["MK_HISTORY"] = "0"  # do not record the query itself
+
+    scripts = [args.script] if args.script else RunHistory.scripts(args.db)
+    regressions = 0
+    for script in scripts:
+        print(f"{script}:")
+        print(f"  {'step':<50} {'runs':>5} {'last':>9} {'p50':>9} {'p95':>9}")
+        for s in RunHistory.step_stats(script, last_runs=args.last, path=args.db):
+            flag = ""
+            if s.is_regression(args.threshold):
+                flag = f"  << regression, previous p50 {_format_ns(s.previous_p50_ns)}"
+                regressions += 1
+            print(
+                f"  {s.title[:50]:<50} {s.runs:>5} {_format_ns(s.last_ns):>9} "
+                f"{_format_ns(s.p50_ns):>9} {_format_ns(s.p95_ns):>9}{flag}"
+            )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
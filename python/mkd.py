@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# cSpell: words getuid execv
+
+"""
+Tiny client of the warm mk daemon. Intentionally does not import `mk`: it only forwards
+argv, cwd, environment and stdio to the daemon and reports the script exit code.
+
+  python3 -m mkd serve [SOCKET]      start the daemon in foreground
+  python3 -m mkd stop [SOCKET]       stop the daemon
+  python3 -m mkd script.py [ARGS]    run the script in the daemon (or directly if the daemon is not running)
+  python3 -m mkd -m MODULE [ARGS]    run the module, as python -m does
+  python3 -m mkd -c CODE [ARGS]      run the code, as python -c does
+"""
+
+import os
+import sys
+import json
+import signal
+import socket
+import struct
+
+_LENGTH = struct.Struct("!Q")
+_PID = struct.Struct("!q")
+_CODE = struct.Struct("!i")
+
+
+def _socket_path() -> str:
+    # keep in sync with mk.core.daemon.default_socket_path()
+    path = os.environ.get("MK_DAEMON_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "mk-daemon.sock")
+    return f"/tmp/mk-daemon-{os.getuid()}.sock"
+
+
+def _connect(path: str):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return s
+    except OSError:
+        s.close()
+        return None
+
+
+def _send(s: socket.socket, request: dict, fds: list):
+    body = json.dumps(request).encode("utf-8")
+    socket.send_fds(s, [_LENGTH.pack(len(body))], fds)
+    s.sendall(body)
+
+
+def _receive(s: socket.socket, size: int) -> bytes | None:
+    data = b""
+    while len(data) < size:
+        chunk = s.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _request(argv: list) -> dict | None:
+    """The daemon request of `python <argv>`, sys.argv as the interpreter sets it; None if the daemon cannot run it"""
+    request = {"cwd": os.getcwd(), "env": dict(os.environ)}
+    if argv[0] == "-m" and len(argv) > 1:
+        # argv[0] becomes the module path once found, as with python -m
+        request.update(module=argv[1], argv=["-m"] + argv[2:])
+    elif argv[0] == "-c" and len(argv) > 1:
+        request.update(code=argv[1], argv=["-c"] + argv[2:])
+    elif argv[0].startswith("-"):
+        return None  # other interpreter options
+    else:
+        request.update(argv=argv)
+    return request
+
+
+def run(argv: list) -> int:
+    request = _request(argv)
+    s = _connect(_socket_path()) if request is not None else None
+    if s is None:
+        # no daemon: behave as a direct run
+        os.execv(sys.executable, [sys.executable] + argv)
+
+    _send(s, request, [0, 1, 2])
+    data = _receive(s, _PID.size)
+    if data is None:
+        print("mkd: the daemon dropped the request", file=sys.stderr)
+        return 1
+    (pid,) = _PID.unpack(data)
+
+    # the worker is not in the terminal foreground process group, forward the interruption
+    def forward(signal_no, _):
+        try:
+            os.kill(pid, signal_no)
+        except OSError:
+            pass
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+
+    data = _receive(s, _CODE.size)
+    s.close()
+    return 1 if data is None else _CODE.unpack(data)[0]
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__ or "usage: mkd serve|stop|<script.py> [args]", file=sys.stderr)
+        return 2
+
+    if args[0] == "serve":
+        from mk.core.daemon import serve  # pylint: disable=import-outside-toplevel
+
+        serve(args[1] if len(args) > 1 else None)
+        return 0
+
+    if args[0] == "stop":
+        s = _connect(args[1] if len(args) > 1 else _socket_path())
+        if s is None:
+            print("mkd: the daemon is not running", file=sys.stderr)
+            return 1
+        _send(s, {"command": "stop"}, [])
+        s.close()
+        return 0
+
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mk.core.fs import File, Directory  # noqa: E402 # pylint: disable=wrong-import-position
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.root = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_write_through_symlink_into_another_directory(self):
+        os.mkdir(os.path.join(self.root, "links"))
+        os.mkdir(os.path.join(self.root, "targets"))
+        target = os.path.join(self.root, "targets", "file.txt")
+        link = os.path.join(self.root, "links", "file.txt")
+        with open(target, "w", encoding="utf-8") as f:
+            f.write("old")
+        os.symlink(os.path.join("..", "targets", "file.txt"), link)
+
+        File(link).write_text("new", fsync=True)
+
+        self.assertTrue(os.path.islink(link))
+        with open(target, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "new")
+        self.assertEqual(os.listdir(os.path.join(self.root, "links")), ["file.txt"])
+        self.assertEqual(os.listdir(os.path.join(self.root, "targets")), ["file.txt"])
+
+
+class PatchFilesTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.root = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_dangling_links_are_skipped(self):
+        path = os.path.join(self.root, "a.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("version 1\n")
+        os.symlink("missing.txt", os.path.join(self.root, "b.txt"))
+
+        changed = Directory(self.root).patch_files("*.txt", {r"version \d": "version 2"}, log=False)
+
+        self.assertEqual([p.fspath for p in changed], [path])
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "version 2\n")
+
+
+class SyncToTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.source = os.path.join(self._tmp.name, "source")
+        self.destination = os.path.join(self._tmp.name, "destination")
+        os.mkdir(self.source)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_extras_sharing_a_name_prefix_are_deleted_once(self):
+        os.makedirs(os.path.join(self.destination, "extra", "deep"))
+        os.makedirs(os.path.join(self.destination, "extra-b"))
+        with open(os.path.join(self.destination, "extra", "deep", "file.txt"), "w", encoding="utf-8") as f:
+            f.write("extra")
+
+        report = Directory(self.source).sync_to(self.destination, log=False)
+
+        self.assertEqual(report.deleted, ["extra", "extra-b"])
+        self.assertEqual(os.listdir(self.destination), [])
+
+
+class ListTest(unittest.TestCase):
+    def test_recursive_listing_of_missing_directory_is_empty(self):
+        with tempfile.TemporaryDirectory() as root:
+            directory = Directory(os.path.join(root, "missing"), create_if_needed=False)
+            self.assertEqual(directory.list(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# cSpell: words importtime
+
+# `import mk` is paid by every script, however small. The budget is the cumulative `python -X importtime` time
+# of the mk package, the best of a few runs: MK_IMPORT_BUDGET_MS, 120 ms by default.
+
+import os
+import sys
+import subprocess
+import unittest
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = float(os.environ.get("MK_IMPORT_BUDGET_MS", "120"))
+RUNS = 5
+
+# loaded on use only
+DEFERRED_MODULES = [
+    "rich",
+    "PIL",
+    "pync",
+    "dateutil",
+    "ctypes",
+    "cProfile",
+    "pstats",
+    "tracemalloc",
+    "urllib.request",
+    "concurrent.futures",
+    "mk.core.watch",
+    "mk.devtools",
+]
+
+
+def _import_mk(code: str = "import mk") -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in [PACKAGE_ROOT, os.environ.get("PYTHONPATH")] if p))
+    env["MK_HISTORY"] = "0"
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PACKAGE_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _cumulative_us(importtime_output: str, module: str) -> int:
+    for line in importtime_output.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1])
+    raise AssertionError(f"{module} is not in the importtime output")
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_import_mk_is_within_budget(self):
+        best_ms = min(_cumulative_us(_import_mk().stderr, "mk") / 1000 for _ in range(RUNS))
+        self.assertLessEqual(best_ms, BUDGET_MS, f"`import mk` takes {best_ms:.1f} ms, the budget is {BUDGET_MS:g} ms")
+
+    def test_heavy_modules_are_deferred(self):
+        code = f"import sys, mk; print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+        loaded = _import_mk(code).stdout.split()
+        self.assertEqual(loaded, [], f"`import mk` loads {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    unittest.main()